@@ -0,0 +1,67 @@
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time
+from voter_io import EXECUTOR_CHOICES, combine_csv_files, list_csv_files
+
+
+HEADERS = [
+    'सि.नं.',
+    'मतदाता नं',
+    'मतदाताको नाम',
+    'उमेर(वर्ष)',
+    'लिङ्ग',
+    'पति/पत्नीको नाम',
+    'पिता/माताको नाम',
+    'मतदाता विवरण'
+]
+NAMES = ['राम बहादुर श्रेष्ठ', 'सीता कुमारी क्षेत्री', 'हरि प्रसाद शर्मा', 'श्री कृष्ण थापा', 'गीता देवी पौडेल']
+
+
+def make_files(folder, count, rows):
+    # small files shaped like the downloaded voter lists
+    random.seed(0)
+    for i in range(count):
+        with open(os.path.join(folder, f"municipality_{i % 9 + 1}_center {i}.csv"), 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(HEADERS)
+            for j in range(rows):
+                writer.writerow([j + 1, 10000000 + i * rows + j, random.choice(NAMES), random.randint(18, 90),
+                                 random.choice(['पुरुष', 'महिला']), random.choice(NAMES + ['-']), random.choice(NAMES), ''])
+
+
+def run(files, workers, executor='thread', output=os.devnull):
+    # the same path as create_single_file.py: header pass, read, append to one file
+    start = time.perf_counter()
+    with open(output, 'w', encoding='utf-8', newline='') as out:
+        rows = combine_csv_files(files, out, workers, executor, log=lambda message: None)
+    return time.perf_counter() - start, rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare serial and parallel create_single_file.py runs over many small CSV files (files per second)')
+    parser.add_argument('--source', type=str, default=None, help='Folder of CSV files to read; synthetic files are generated if not given')
+    parser.add_argument('--files', type=int, default=2000, help='Number of synthetic files')
+    parser.add_argument('--rows', type=int, default=400, help='Rows per synthetic file')
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4, 8], help='Worker counts to compare against the serial loop')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = args.source
+        if source is None:
+            source = tmp
+            make_files(source, args.files, args.rows)
+        files = list_csv_files(source)
+
+        # warm the OS file cache so every run reads from memory
+        run(files, 1)
+
+        serial, rows = run(files, 1)
+        print(f"{os.cpu_count()} CPU cores, {len(files)} files, {rows} rows")
+        print(f"serial      : {len(files) / serial:8.1f} files/s")
+        for executor in EXECUTOR_CHOICES:
+            for workers in args.workers:
+                elapsed, _ = run(files, workers, executor)
+                print(f"{executor:7} x{workers:<3}: {len(files) / elapsed:8.1f} files/s ({serial / elapsed:.2f}x)")
@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+import requests
+from hedging import Attempt
+from voter_stream import CHUNK_SIZE, response_encoding
+
+
+class DownloadCancelled(Exception):
+    pass
+
+
+class CancelToken:
+    # shared by one download run: cancel() wakes every waiting request, runs the
+    # registered callbacks (eg. dropping queued futures) and lets workers bail out
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.callbacks = []
+        self.partial_files = set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def cancel(self):
+        with self.lock:
+            self.event.set()
+            callbacks = list(self.callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def on_cancel(self, callback):
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return callback
+        callback()
+        return callback
+
+    def remove_callback(self, callback):
+        with self.lock:
+            if callback in self.callbacks:
+                self.callbacks.remove(callback)
+
+    def check(self):
+        if self.event.is_set():
+            raise DownloadCancelled()
+
+    def run(self, fn, deadline, on_abort=None):
+        # runs fn in a daemon thread and waits at most `deadline` seconds for it;
+        # on cancel or deadline the caller returns right away and the stuck
+        # call is abandoned (on_abort gets a chance to close its connection)
+        self.check()
+        result = {}
+        finished = threading.Event()
+
+        def _target():
+            try:
+                result['value'] = fn()
+            except Exception as e:
+                result['error'] = e
+            finally:
+                finished.set()
+
+        threading.Thread(target=_target, daemon=True).start()
+        callback = self.on_cancel(finished.set)
+        try:
+            finished.wait(deadline)
+        finally:
+            self.remove_callback(callback)
+
+        if 'value' not in result and 'error' not in result:
+            if on_abort:
+                on_abort()
+            if self.cancelled:
+                raise DownloadCancelled()
+            raise requests.exceptions.Timeout(f"No complete response within {deadline}s")
+        if 'error' in result:
+            raise result['error']
+        return result['value']
+
+    def post(self, url, data, deadline, timeout=None):
+        # POST with a wall clock deadline for the whole request, not only per read;
+        # an abandoned request has its socket shut down so it stops downloading
+        attempt = Attempt(url, data, timeout or deadline)
+        return self.run(attempt.run, deadline, on_abort=attempt.cancel)
+
+    def stream(self, url, data, deadline, timeout=None, chunk_size=CHUNK_SIZE):
+        # POST whose body is read chunk by chunk; returns (chunks, encoding).
+        # the headers are waited for like post(), the body keeps the same deadline
+        started = time.monotonic()
+        attempt = Attempt(url, data, timeout or deadline, stream=True)
+        response = self.run(attempt.run, deadline, on_abort=attempt.cancel)
+        remaining = deadline - (time.monotonic() - started)
+        return self._iter_body(attempt, response, remaining, chunk_size), response_encoding(response)
+
+    def _iter_body(self, attempt, response, remaining, chunk_size):
+        # cancel or the deadline shut the socket down, so a blocked read ends at once
+        expired = threading.Event()
+
+        def _expire():
+            expired.set()
+            attempt.cancel()
+
+        timer = threading.Timer(max(remaining, 0), _expire)
+        timer.daemon = True
+        timer.start()
+        callback = self.on_cancel(attempt.cancel)
+        try:
+            try:
+                for chunk in response.iter_content(chunk_size):
+                    self.check()
+                    yield chunk
+            except DownloadCancelled:
+                raise
+            except Exception:
+                self.check()
+                if expired.is_set():
+                    raise requests.exceptions.Timeout(f"No complete response within {remaining:.0f}s") from None
+                raise
+            # a shut down socket can also look like a normal end of the body
+            self.check()
+            if expired.is_set():
+                raise requests.exceptions.Timeout(f"No complete response within {remaining:.0f}s")
+        finally:
+            timer.cancel()
+            self.remove_callback(callback)
+            response.close()
+            attempt.close()
+
+    def add_partial(self, filepath):
+        with self.lock:
+            self.partial_files.add(filepath)
+
+    def discard_partial(self, filepath):
+        with self.lock:
+            self.partial_files.discard(filepath)
+
+    def cleanup(self):
+        # removes files that were being written when the run stopped
+        with self.lock:
+            partial_files = list(self.partial_files)
+            self.partial_files.clear()
+        for filepath in partial_files:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+        return len(partial_files)
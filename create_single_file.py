@@ -1,13 +1,21 @@
-import pandas as pd
 import os
-from pathlib import Path
 import argparse
+from voter_io import COMPRESSION_CHOICES, EXECUTOR_CHOICES, combine_csv_files, compressed_name, open_csv
+from partitions import list_partition_files, load_municipalities
 
 
 parser = argparse.ArgumentParser(description='Process voter data CSV files')
 parser.add_argument('--source', type=str, default='voter_data_enhanced_english', help='Source folder containing CSV files of the voter data')
 parser.add_argument('--dest', type=str, default='single_file', help='Destination folder for combined single file files')
 parser.add_argument('--dest_file', type=str, default='consolidated_voter_info.csv', help='File name for the combined file name')
+parser.add_argument('--compression', type=str, default='none', choices=COMPRESSION_CHOICES, help='Compress the combined file (compressed source files are read as is)')
+parser.add_argument('--compression_level', type=int, default=None, help='Compression level (gzip/bz2: 1-9, xz: 0-9); codec default if not given')
+parser.add_argument('--province', type=str, default=None, help='Only combine this province (id or name); needs a partitioned source folder')
+parser.add_argument('--district', type=str, default=None, help='Only combine this district (id or name); needs a partitioned source folder')
+parser.add_argument('--municipality', type=str, default=None, help='Only combine this municipality (id or name); needs a partitioned source folder')
+parser.add_argument('--input_json', type=str, default='municipalities.json', help='JSON file with the list of municipalities, used to look up filters given by name')
+parser.add_argument('--workers', type=int, default=1, help='Number of files to read in parallel (output order stays sorted by file path)')
+parser.add_argument('--executor', type=str, default='thread', choices=EXECUTOR_CHOICES, help='Read with threads (slow/network disks) or processes (many CPU cores)')
 args = parser.parse_args()
 
 # src and dst
@@ -16,23 +24,22 @@ dest_folder = args.dest
 dest_fileName = args.dest_file
 os.makedirs(dest_folder, exist_ok=True)
 
-csv_files = list(Path(source_folder).glob('*.csv'))
+# partitioned folders are pruned by the filters
+try:
+    csv_files = list_partition_files(source_folder, args.province, args.district, args.municipality,
+                                     load_municipalities(args.input_json))
+except ValueError as e:
+    parser.error(str(e))
 
 print(f"Found {len(csv_files)} CSV files")
 
-df_list = []
-print(df_list)
+consolidated_file_path = os.path.join(dest_folder, compressed_name(dest_fileName, args.compression))
 
-for csv_file in csv_files:
-    print(f"Reading: {csv_file.name}")
-    df = pd.read_csv(csv_file)
-    df_list.append(df)
-
-consolidated_df = pd.concat(df_list, ignore_index=True)
-
-consolidated_file_path = os.path.join(dest_folder, dest_fileName)
-consolidated_df.to_csv(consolidated_file_path, index=False, )
+# files are read (in parallel with --workers) and appended in path order
+with open_csv(consolidated_file_path, 'wt', args.compression, args.compression_level,
+              encoding='utf-8', newline='') as out:
+    total_rows = combine_csv_files(csv_files, out, args.workers, args.executor)
 
 print(f"\nConsolidation complete!")
-print(f"Total rows: {len(consolidated_df)}")
+print(f"Total rows: {total_rows}")
 print(f"Output file: {consolidated_file_path}")
\ No newline at end of file
@@ -6,21 +6,34 @@ import csv
 import os
 from bs4 import BeautifulSoup
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import multiprocessing
 import threading
 import time
 import pandas as pd
+from voter_db import VoterDatabase, DB_FILE
+from voter_snapshot import SnapshotStore, SNAPSHOT_DIR
+from voter_io import COMPRESSION_CHOICES, compressed_name, to_csv_options
+from task_scheduler import TaskScheduler, COST_JOURNAL
+from hedging import HedgedPoster, HedgeGroup, HEDGE_PERCENTILE, HEDGE_BUDGET
+from partitions import partition_dir
+from cancellation import CancelToken, DownloadCancelled
+from voter_stream import write_voter_stream
 
 
 TIMEOUT = 90
+# wall clock limit for one voter list; TIMEOUT still applies to each read, so a
+# slow but steady download of a large center is not cut off
+DOWNLOAD_DEADLINE = 30 * 60
 MAX_THREADS = 6
+# seconds after cancel before reporting downloads that are still writing
+CANCEL_GRACE = 5
 
 class VoterListDownloader:
     def __init__(self, root):
         self.root = root
         self.root.title("Nepal Voter List Downloader")
-        self.root.geometry("700x700")
+        self.root.geometry("700x880")
         
         # load munis
         self.municipalities_data = self.load_municipalities()
@@ -32,7 +45,15 @@ class VoterListDownloader:
         self.cpu_cores = multiprocessing.cpu_count()
         
         # track download
-        self.download_cancelled = False
+        self.cancel_token = CancelToken()
+        self.db = None
+        self.snapshots = None
+        self.scheduler = None
+        self.hedger = None
+        self.layout = 'flat'
+        self.compression = 'none'
+        self.compression_level = None
+        self.stream = False
         self.setup_ui()
         
     def load_municipalities(self):
@@ -112,6 +133,58 @@ class VoterListDownloader:
         ttk.Label(parallel_frame, text=f"System: {self.cpu_cores} cores detected", 
                  foreground="gray").grid(row=1, column=0, sticky=tk.W)
         
+        # sqlite sink
+        self.sqlite_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            parallel_frame,
+            text=f"Also save to SQLite database ({DB_FILE} in output folder)",
+            variable=self.sqlite_var
+        ).grid(row=2, column=0, sticky=tk.W)
+        
+        # change tracking
+        self.snapshot_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            parallel_frame,
+            text="Track changes between runs (skip unchanged polling centers)",
+            variable=self.snapshot_var
+        ).grid(row=3, column=0, sticky=tk.W)
+        
+        # hedging
+        self.hedge_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            parallel_frame,
+            text=f"Hedge slow requests (retry above p{HEDGE_PERCENTILE:g} latency, max {HEDGE_BUDGET:.0%} extra requests)",
+            variable=self.hedge_var
+        ).grid(row=4, column=0, sticky=tk.W)
+        
+        # output layout
+        self.partitioned_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            parallel_frame,
+            text="Save in province=/district=/municipality=/ward= folders",
+            variable=self.partitioned_var
+        ).grid(row=5, column=0, sticky=tk.W)
+        
+        # compression
+        compression_frame = ttk.Frame(parallel_frame)
+        compression_frame.grid(row=6, column=0, sticky=tk.W, pady=(5, 0))
+        ttk.Label(compression_frame, text="Compression:").grid(row=0, column=0, sticky=tk.W)
+        self.compression_var = tk.StringVar(value='none')
+        ttk.Combobox(compression_frame, textvariable=self.compression_var, values=COMPRESSION_CHOICES,
+                     state='readonly', width=8).grid(row=0, column=1, padx=5)
+        ttk.Label(compression_frame, text="Level:").grid(row=0, column=2, sticky=tk.W)
+        self.compression_level_var = tk.StringVar(value='')
+        ttk.Combobox(compression_frame, textvariable=self.compression_level_var,
+                     values=[''] + [str(i) for i in range(10)], state='readonly', width=4).grid(row=0, column=3, padx=5)
+        
+        # streaming parse
+        self.stream_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            parallel_frame,
+            text="Parse voter lists while downloading (low memory for large polling centers)",
+            variable=self.stream_var
+        ).grid(row=7, column=0, sticky=tk.W)
+        
         # logs
         log_frame = ttk.LabelFrame(main_frame, text="Download Log", padding="5")
         log_frame.grid(row=15, column=0, columnspan=2, pady=10, sticky=(tk.W, tk.E, tk.N, tk.S))
@@ -301,7 +374,7 @@ class VoterListDownloader:
                 return
         
         # dwn in separate thread
-        self.download_cancelled = False
+        self.cancel_token = CancelToken()
         thread = threading.Thread(target=self.download_all_tasks, args=(tasks,))
         thread.daemon = True
         thread.start()
@@ -412,21 +485,47 @@ class VoterListDownloader:
 
         self.log(f"Starting download of {total} voter lists...")
         
+        self.layout = 'partitioned' if self.partitioned_var.get() else 'flat'
+        self.compression = self.compression_var.get()
+        self.compression_level = int(self.compression_level_var.get()) if self.compression_level_var.get() else None
+        self.stream = self.stream_var.get()
+        
+        if self.sqlite_var.get():
+            db_file = os.path.join(self.output_dir, DB_FILE)
+            self.db = VoterDatabase(db_file, log=self.log)
+            self.db.load_geography(self.municipalities_data)
+            self.log(f"Saving to SQLite database: {db_file}")
+        
+        if self.snapshot_var.get():
+            self.snapshots = SnapshotStore(os.path.join(self.output_dir, SNAPSHOT_DIR), log=self.log)
+        
+        # largest centers first, from earlier runs' sizes
+        self.scheduler = TaskScheduler(os.path.join(self.output_dir, COST_JOURNAL),
+                                       os.path.join(self.output_dir, SNAPSHOT_DIR), self.task_filepath, log=self.log)
+        tasks = self.scheduler.order(tasks)
+        
+        if self.hedge_var.get():
+            workers = min(MAX_THREADS, self.cpu_cores) if self.parallel_var.get() else 1
+            self.hedger = HedgedPoster(TIMEOUT, workers, log=self.log)
+        
         # parallel or serial
         if self.parallel_var.get():
             max_workers = min(MAX_THREADS, self.cpu_cores)
             self.log(f"Using {max_workers} parallel threads")
             
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                futures = {executor.submit(self.download_single_task, task): task 
-                        for task in tasks}
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+            futures = {executor.submit(self.download_single_task, task): task 
+                    for task in tasks}
+            
+            # cancel drops every queued future right away
+            self.cancel_token.on_cancel(lambda: executor.shutdown(wait=False, cancel_futures=True))
+            
+            # wait with a timeout so a cancel is noticed even when nothing completes
+            pending = set(futures)
+            while pending and not self.cancel_token.cancelled:
+                done, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
                 
-                for future in as_completed(futures):
-                    if self.download_cancelled:
-                        executor.shutdown(wait=False)
-                        self.log("Download cancelled by user")
-                        break
-                    
+                for future in done:
                     task = futures[future]
                     try:
                         success = future.result()
@@ -437,10 +536,22 @@ class VoterListDownloader:
                     except Exception as e:
                         failed += 1
                         self.log(f"Error: {task['municipality_name']}/{task['ward_id']}/{task['reg_center_name']} - {e}")
+            
+            if self.cancel_token.cancelled:
+                # in-flight requests were woken by the cancel and return at once; a
+                # download that was already writing its file is let finish, since
+                # the database, snapshots and scheduler are only closed after it
+                running = [f for f in pending if not f.cancelled()]
+                _, running = wait(running, timeout=CANCEL_GRACE)
+                if running:
+                    self.log(f"Waiting for {len(running)} downloads to finish writing...")
+                    wait(running)
+                self.log("Download cancelled by user")
+            executor.shutdown(wait=False)
                     
         else:
             for task in tasks:
-                if self.download_cancelled:
+                if self.cancel_token.cancelled:
                     self.log("Download cancelled by user")
                     break
                 
@@ -453,11 +564,30 @@ class VoterListDownloader:
                 except Exception as e:
                     failed += 1
                     self.log(f"Error: {task['municipality_name']}/{task['ward_id']}/{task['reg_center_name']} - {e}")
+        
+        removed = self.cancel_token.cleanup()
+        if removed:
+            self.log(f"Removed {removed} partially written files")
+        
+        if self.db:
+            self.db.close()
+            self.db = None
+        
+        if self.snapshots:
+            self.snapshots.save()
+            self.snapshots = None
+        
+        self.scheduler.save()
+        self.scheduler = None
+        
+        if self.hedger:
+            self.hedger.shutdown()
+            self.hedger = None
                         
         # Final status
         def _final_status():
             self.status_label.config(
-                text=f" Complete: {completed} downloaded, {failed} failed",
+                text=f" {'Cancelled' if self.cancel_token.cancelled else 'Complete'}: {completed} downloaded, {failed} failed",
                 foreground="green" if failed == 0 else "orange"
             )
             self.download_btn.config(state='normal')
@@ -471,6 +601,9 @@ class VoterListDownloader:
     
     def download_single_task(self, task):
         try:
+            if self.stream:
+                return self.stream_single_task(task)
+            
             voters_html = self.extract_voters(
                 task['province_id'],
                 task['district_id'],
@@ -492,8 +625,21 @@ class VoterListDownloader:
                 self.log(f"No voters: {task['municipality_name']}/{task['ward_id']}/{task['reg_center_name']}")
                 return False
             
-            filename = f"{task['municipality_name']}_{task['ward_id']}_{task['reg_center_name']}"
-            filepath = os.path.join(self.output_dir, f"{filename}.csv")
+            if self.scheduler:
+                self.scheduler.record(task, len(voters_record))
+            
+            if self.db:
+                self.db.write_voters(task, voters_record)
+            
+            filepath = self.task_filepath(task)
+            
+            # unchanged centers are not rewritten
+            change = None
+            if self.snapshots:
+                change = self.snapshots.check(task, voters_record, filepath)
+                if not change:
+                    self.snapshots.unchanged(task)
+                    return True
             
             headers = [
                 'सि.नं.', 
@@ -507,16 +653,93 @@ class VoterListDownloader:
             ]
             
             df = pd.DataFrame(voters_record, columns=headers)
-            df.to_csv(filepath, index=False, encoding='utf-8-sig')
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            
+            # write to a .part file so a cancelled run never leaves half a csv behind
+            part_path = f"{filepath}.part"
+            self.cancel_token.add_partial(part_path)
+            try:
+                df.to_csv(part_path, index=False, encoding='utf-8-sig',
+                          **to_csv_options(self.compression, self.compression_level))
+                self.cancel_token.check()
+                os.replace(part_path, filepath)
+            finally:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                self.cancel_token.discard_partial(part_path)
+            
+            # the new hash is recorded only once the file is in place
+            if change:
+                self.snapshots.commit(task, *change)
             
-            self.log(f"{filename}.csv ({len(voters_record)} voters)")
+            self.log(f"{os.path.basename(filepath)} ({len(voters_record)} voters)")
             return True
             
+        except DownloadCancelled:
+            return False
         except Exception as e:
             self.log(f"Error downloading {task['municipality_name']}/{task['ward_id']}: {str(e)}")
             return False
     
-    def extract_voters(self, state, district, vdc_mun, ward, reg_centre):
+    def stream_single_task(self, task):
+        # rows go from the response straight to a .part file; the database,
+        # snapshot and final csv are then fed from that file
+        filepath = self.task_filepath(task)
+        part_path = f"{filepath}.part"
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        self.cancel_token.add_partial(part_path)
+        try:
+            chunks, encoding = self.extract_voters(
+                task['province_id'],
+                task['district_id'],
+                task['municipality_id'],
+                task['ward_id'],
+                task['reg_center_id'],
+                stream=True
+            )
+            found_table, voter_count = write_voter_stream(chunks, part_path, self.compression,
+                                                          self.compression_level, encoding)
+            
+            if not found_table:
+                self.log(f"No table found: {task['municipality_name']}/{task['ward_id']}/{task['reg_center_name']}")
+                return False
+            
+            if not voter_count:
+                self.log(f"No voters: {task['municipality_name']}/{task['ward_id']}/{task['reg_center_name']}")
+                return False
+            
+            if self.scheduler:
+                self.scheduler.record(task, voter_count)
+            
+            if self.db:
+                self.db.write_voters_file(task, part_path)
+            
+            # unchanged centers are not rewritten
+            change = None
+            if self.snapshots:
+                change = self.snapshots.check_file(task, part_path, filepath)
+                if not change:
+                    self.snapshots.unchanged(task)
+                    return True
+            
+            self.cancel_token.check()
+            os.replace(part_path, filepath)
+            # the new hash is recorded only once the file is in place
+            if change:
+                self.snapshots.commit(task, *change)
+            self.log(f"{os.path.basename(filepath)} ({voter_count} voters)")
+            return True
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            self.cancel_token.discard_partial(part_path)
+    
+    def task_filepath(self, task):
+        filename = f"{task['municipality_name']}_{task['ward_id']}_{task['reg_center_name']}"
+        folder = partition_dir(self.output_dir, task) if self.layout == 'partitioned' else self.output_dir
+        return os.path.join(folder, compressed_name(f"{filename}.csv", self.compression))
+    
+    def extract_voters(self, state, district, vdc_mun, ward, reg_centre, stream=False):
         url = 'https://voterlist.election.gov.np/view_ward.php'
         form_data = {
             'state': state,
@@ -525,8 +748,16 @@ class VoterListDownloader:
             'ward': ward,
             'reg_centre': reg_centre
         }
-        response = requests.post(url, data=form_data, timeout=TIMEOUT)
-        return response.content
+        # every request has a wall clock deadline and is abandoned on cancel
+        if self.hedger:
+            # hedged responses arrive whole, stream mode still parses them without a tree
+            group = HedgeGroup()
+            content = self.cancel_token.run(lambda: self.hedger.post(url, form_data, group), DOWNLOAD_DEADLINE,
+                                            on_abort=group.cancel)
+            return ([content], 'utf-8') if stream else content
+        if stream:
+            return self.cancel_token.stream(url, form_data, DOWNLOAD_DEADLINE, timeout=TIMEOUT)
+        return self.cancel_token.post(url, form_data, DOWNLOAD_DEADLINE, timeout=TIMEOUT)
     
     def get_table_rows(self, table):
         data_rows = []
@@ -556,7 +787,7 @@ class VoterListDownloader:
         return data_rows
     
     def cancel_download(self):
-        self.download_cancelled = True
+        self.cancel_token.cancel()
         self.cancel_btn.config(state='disabled')
         self.log("Cancelling download...")
     
@@ -10,12 +10,32 @@ import pandas as pd
 import time
 import threading
 import argparse
+from voter_db import VoterDatabase, DB_FILE
+from voter_snapshot import SnapshotStore, SNAPSHOT_DIR
+from voter_io import COMPRESSION_CHOICES, compressed_name, to_csv_options
+from task_scheduler import TaskScheduler, COST_JOURNAL
+from hedging import HedgedPoster, HEDGE_PERCENTILE, HEDGE_BUDGET
+from partitions import LAYOUT_CHOICES, partition_dir
+from voter_stream import iter_body, response_encoding, write_voter_stream
 
 TIMEOUT = 90
 MAX_THREADS = 6
 
 parser = argparse.ArgumentParser(description='Input JSON file')
 parser.add_argument('--input_json', type=str, default='municipalities.json', help='Input JSON file containing the list of municipalities')
+parser.add_argument('--storage', type=str, default='csv', choices=['csv', 'sqlite', 'both'], help='Where to save the voter lists: one CSV per polling center, a single SQLite database, or both')
+parser.add_argument('--db_file', type=str, default=DB_FILE, help='SQLite database file used when storage is sqlite or both')
+parser.add_argument('--snapshot_dir', type=str, default=None, help=f'Track changes between runs in this folder (eg. {SNAPSHOT_DIR}); unchanged polling centers are not rewritten')
+parser.add_argument('--layout', type=str, default='flat', choices=LAYOUT_CHOICES, help='flat: all CSV files in voter_data/, partitioned: voter_data/province=/district=/municipality=/ward=/ folders')
+parser.add_argument('--compression', type=str, default='none', choices=COMPRESSION_CHOICES, help='Compress the voter list CSV files')
+parser.add_argument('--cost_journal', type=str, default=COST_JOURNAL, help='File with the voter count of each polling center from earlier runs, used to start the largest centers first')
+parser.add_argument('--priority_province', type=str, nargs='*', default=[], help='Province ids or names to download before everything else')
+parser.add_argument('--priority_district', type=str, nargs='*', default=[], help='District ids or names to download before everything else (ahead of priority provinces)')
+parser.add_argument('--hedge', action='store_true', help='Send a duplicate request when a voter list request is slower than usual, and use whichever answers first')
+parser.add_argument('--hedge_percentile', type=float, default=HEDGE_PERCENTILE, help='Latency percentile after which a request is hedged')
+parser.add_argument('--hedge_budget', type=float, default=HEDGE_BUDGET, help='Maximum share of extra (hedged) requests sent to the server, eg. 0.05 = 5%%')
+parser.add_argument('--compression_level', type=int, default=None, help='Compression level (gzip/bz2: 1-9, xz: 0-9); codec default if not given')
+parser.add_argument('--stream', action='store_true', help='Parse each voter list while it downloads and write the rows as they arrive, so large polling centers are never held in memory')
 args = parser.parse_args()
 
 INPUT_JSON_FILE = args.input_json
@@ -30,6 +50,30 @@ class VoterListDownloader:
         self.failed_records = []
         self.lock = threading.Lock()
         
+        self.layout = args.layout
+        self.compression = args.compression
+        self.compression_level = args.compression_level
+        self.stream = args.stream
+        
+        # sqlite sink (single writer thread)
+        self.write_csv = args.storage in ('csv', 'both')
+        self.db = None
+        if args.storage in ('sqlite', 'both'):
+            self.db = VoterDatabase(args.db_file, log=self.log)
+            self.db.load_geography(self.municipalities_data)
+        
+        # per center hashes and voter deltas between runs
+        self.snapshots = SnapshotStore(args.snapshot_dir, log=self.log) if args.snapshot_dir else None
+        
+        # duplicate slow requests (within a global budget)
+        self.hedger = None
+        if args.hedge:
+            self.hedger = HedgedPoster(TIMEOUT, min(MAX_THREADS, self.cpu_cores),
+                                       args.hedge_percentile, args.hedge_budget, log=self.log)
+        
+        # largest centers first, from earlier runs' sizes
+        self.scheduler = TaskScheduler(args.cost_journal, args.snapshot_dir, self.task_filepath, log=self.log)
+        
     def load_municipalities(self):
         try:
             with open(INPUT_JSON_FILE, 'r', encoding='utf-8') as f:
@@ -158,12 +202,16 @@ class VoterListDownloader:
         
         if not tasks:
             self.log("No tasks to download!")
+            if self.db:
+                self.db.close()
             return
         
         total = len(tasks)
         completed = 0
         failed = 0
         
+        tasks = self.scheduler.order(tasks, args.priority_province, args.priority_district)
+        
         self.log(f"Starting download of {total} voter lists...")
         
         max_workers = min(MAX_THREADS, self.cpu_cores)
@@ -191,11 +239,26 @@ class VoterListDownloader:
         
         self.log(f"Download complete: {completed} successful, {failed} failed out of {total}")
         
+        if self.db:
+            self.db.close()
+            self.log(f"Saved voter lists to {args.db_file}")
+        
+        if self.snapshots:
+            self.snapshots.save()
+        
+        self.scheduler.save()
+        
+        if self.hedger:
+            self.hedger.shutdown()
+        
         # Save failed records at the end
         self.save_failed_records()
     
     def download_single_task(self, task):
         try:
+            if self.stream:
+                return self.stream_single_task(task)
+            
             voters_html = self.extract_voters(
                 task['province_id'],
                 task['district_id'],
@@ -221,8 +284,24 @@ class VoterListDownloader:
                 self.add_failed_record(task, 'no_voters', error_msg)
                 return False
             
-            filename = f"{task['municipality_name']}_{task['ward_id']}_{task['reg_center_name']}"
-            filepath = os.path.join(self.output_dir, f"{filename}.csv")
+            if self.scheduler:
+                self.scheduler.record(task, len(voters_record))
+            
+            if self.db:
+                self.db.write_voters(task, voters_record)
+            
+            if not self.write_csv:
+                return True
+            
+            filepath = self.task_filepath(task)
+            
+            # unchanged centers are not rewritten
+            change = None
+            if self.snapshots:
+                change = self.snapshots.check(task, voters_record, filepath)
+                if not change:
+                    self.snapshots.unchanged(task)
+                    return True
             
             headers = [
                 'सि.नं.', 
@@ -236,8 +315,13 @@ class VoterListDownloader:
             ]
             
             df = pd.DataFrame(voters_record, columns=headers)
-            df.to_csv(filepath, index=False, encoding='utf-8-sig')
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            df.to_csv(filepath, index=False, encoding='utf-8-sig',
+                      **to_csv_options(self.compression, self.compression_level))
             
+            # the new hash is recorded only once the file is in place
+            if change:
+                self.snapshots.commit(task, *change)
             return True
             
         except requests.exceptions.Timeout as e:
@@ -256,7 +340,68 @@ class VoterListDownloader:
             self.add_failed_record(task, 'unknown_error', error_msg)
             return False
     
-    def extract_voters(self, state, district, vdc_mun, ward, reg_centre):
+    def stream_single_task(self, task):
+        # rows go from the response straight to a .part file; the database,
+        # snapshot and final csv are then fed from that file
+        filepath = self.task_filepath(task)
+        part_path = f"{filepath}.part"
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        try:
+            chunks, encoding = self.extract_voters(
+                task['province_id'],
+                task['district_id'],
+                task['municipality_id'],
+                task['ward_id'],
+                task['reg_center_id'],
+                stream=True
+            )
+            found_table, voter_count = write_voter_stream(chunks, part_path, self.compression,
+                                                          self.compression_level, encoding)
+            
+            if not found_table:
+                error_msg = "No table found in response"
+                self.log(f"{error_msg}: {task['municipality_name']}/{task['ward_id']}/{task['reg_center_name']}")
+                self.add_failed_record(task, 'no_table', error_msg)
+                return False
+            
+            if not voter_count:
+                error_msg = "No voter records found"
+                self.log(f"{error_msg}: {task['municipality_name']}/{task['ward_id']}/{task['reg_center_name']}")
+                self.add_failed_record(task, 'no_voters', error_msg)
+                return False
+            
+            if self.scheduler:
+                self.scheduler.record(task, voter_count)
+            
+            if self.db:
+                self.db.write_voters_file(task, part_path)
+            
+            if not self.write_csv:
+                return True
+            
+            # unchanged centers are not rewritten
+            change = None
+            if self.snapshots:
+                change = self.snapshots.check_file(task, part_path, filepath)
+                if not change:
+                    self.snapshots.unchanged(task)
+                    return True
+            
+            os.replace(part_path, filepath)
+            # the new hash is recorded only once the file is in place
+            if change:
+                self.snapshots.commit(task, *change)
+            return True
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+    
+    def task_filepath(self, task):
+        filename = f"{task['municipality_name']}_{task['ward_id']}_{task['reg_center_name']}"
+        folder = partition_dir(self.output_dir, task) if self.layout == 'partitioned' else self.output_dir
+        return os.path.join(folder, compressed_name(f"{filename}.csv", self.compression))
+    
+    def extract_voters(self, state, district, vdc_mun, ward, reg_centre, stream=False):
         url = 'https://voterlist.election.gov.np/view_ward.php'
         form_data = {
             'state': state,
@@ -265,7 +410,13 @@ class VoterListDownloader:
             'ward': ward,
             'reg_centre': reg_centre
         }
-        response = requests.post(url, data=form_data, timeout=TIMEOUT)
+        if self.hedger:
+            # hedged responses arrive whole, stream mode still parses them without a tree
+            content = self.hedger.post(url, form_data)
+            return ([content], 'utf-8') if stream else content
+        response = requests.post(url, data=form_data, timeout=TIMEOUT, stream=stream)
+        if stream:
+            return iter_body(response), response_encoding(response)
         return response.content
     
     def get_table_rows(self, table):
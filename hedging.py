@@ -0,0 +1,217 @@
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from requests.adapters import HTTPAdapter
+
+
+HEDGE_PERCENTILE = 95
+HEDGE_BUDGET = 0.05
+MIN_SAMPLES = 20
+MIN_HEDGE_DELAY = 1.0
+
+
+class LatencyTracker:
+    # sliding window of recent request latencies
+    def __init__(self, window=500, min_samples=MIN_SAMPLES):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def percentile(self, p):
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * p / 100))
+        return ordered[index]
+
+
+class HedgeBudget:
+    # token bucket: every request adds `ratio` of a token, every hedge spends
+    # one, so hedges stay under ratio * requests (plus a small burst)
+    def __init__(self, ratio=HEDGE_BUDGET, burst=5):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = 0.0
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.hedges = 0
+
+    def on_request(self):
+        with self.lock:
+            self.requests += 1
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_acquire(self):
+        with self.lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.hedges += 1
+                return True
+            return False
+
+
+def _tracking_connection(connection_cls, on_socket):
+    class TrackingConnection(connection_cls):
+        def connect(self):
+            super().connect()
+            on_socket(self.sock)
+    return TrackingConnection
+
+
+class SocketTrackingAdapter(HTTPAdapter):
+    # hands every socket it opens to on_socket, so a request that is still
+    # waiting for its headers can be interrupted by shutting the socket down
+    def __init__(self, on_socket):
+        self.on_socket = on_socket
+        super().__init__()
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: type(pool_cls.__name__, (pool_cls,), {
+                'ConnectionCls': _tracking_connection(pool_cls.ConnectionCls, self.on_socket)
+            })
+            for scheme, pool_cls in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+
+class Attempt:
+    # one POST that can be aborted from another thread by shutting its socket down.
+    # with stream=True run() returns the response unread and close() ends it
+    def __init__(self, url, data, timeout, stream=False):
+        self.url = url
+        self.data = data
+        self.timeout = timeout
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.sockets = []
+        self.cancelled = False
+        self.session = requests.Session()
+        adapter = SocketTrackingAdapter(self._on_socket)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _on_socket(self, sock):
+        with self.lock:
+            self.sockets.append(sock)
+            cancelled = self.cancelled
+        if cancelled:
+            self._shutdown(sock)
+
+    @staticmethod
+    def _shutdown(sock):
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def run(self):
+        try:
+            response = self.session.post(self.url, data=self.data, timeout=self.timeout, stream=self.stream)
+            if self.cancelled:
+                response.close()
+                raise requests.exceptions.ConnectionError("Request cancelled")
+            if self.stream:
+                return response
+            return response.content
+        except requests.exceptions.RequestException:
+            self.session.close()
+            if self.cancelled:
+                raise requests.exceptions.ConnectionError("Request cancelled") from None
+            raise
+        finally:
+            if not self.stream:
+                self.session.close()
+
+    def close(self):
+        self.session.close()
+
+    def cancel(self):
+        # also ends a read that is blocked waiting for the response headers
+        with self.lock:
+            self.cancelled = True
+            sockets = list(self.sockets)
+        for sock in sockets:
+            self._shutdown(sock)
+
+
+class HedgeGroup:
+    # the attempts of one hedged post; cancel() aborts all of them, including
+    # a hedge that only starts after the cancel
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.attempts = []
+        self.cancelled = False
+
+    def add(self, attempt):
+        with self.lock:
+            self.attempts.append(attempt)
+            cancelled = self.cancelled
+        if cancelled:
+            attempt.cancel()
+        return attempt
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            attempts = list(self.attempts)
+        for attempt in attempts:
+            attempt.cancel()
+
+
+class HedgedPoster:
+    # sends a duplicate request when the first one is slower than the tracked
+    # latency percentile, and uses whichever answers first
+    def __init__(self, timeout, max_workers, percentile=HEDGE_PERCENTILE, budget=HEDGE_BUDGET, log=print):
+        self.timeout = timeout
+        self.percentile = percentile
+        self.tracker = LatencyTracker()
+        self.budget = HedgeBudget(budget)
+        self.log = log
+        # room for every worker's primary request plus its hedge
+        self.executor = ThreadPoolExecutor(max_workers=max_workers * 2, thread_name_prefix='hedge')
+
+    def post(self, url, data, group=None):
+        # pass a HedgeGroup to be able to abort the request from another thread
+        group = group or HedgeGroup()
+        self.budget.on_request()
+        start = time.monotonic()
+
+        primary = group.add(Attempt(url, data, self.timeout))
+        attempts = {self.executor.submit(primary.run): primary}
+
+        delay = self.tracker.percentile(self.percentile)
+        if delay is not None:
+            done, _ = wait(attempts, timeout=max(delay, MIN_HEDGE_DELAY))
+            if not done and self.budget.try_acquire():
+                self.log(f"Hedging request after {time.monotonic() - start:.1f}s (p{self.percentile} = {delay:.1f}s)")
+                hedge = group.add(Attempt(url, data, self.timeout))
+                attempts[self.executor.submit(hedge.run)] = hedge
+
+        pending = set(attempts)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # first good answer wins, abort the rest
+                    for other in pending:
+                        other.cancel()
+                        attempts[other].cancel()
+                    self.tracker.observe(time.monotonic() - start)
+                    return future.result()
+                error = error or future.exception()
+
+        raise error
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+        self.log(f"Hedged {self.budget.hedges} of {self.budget.requests} requests")
@@ -0,0 +1,79 @@
+import json
+import os
+from pathlib import Path
+from voter_io import list_csv_files
+
+
+# province=1/district=3/municipality=5018/ward=4/<file>.csv
+PARTITION_KEYS = ['province', 'district', 'municipality', 'ward']
+LAYOUT_CHOICES = ['flat', 'partitioned']
+
+
+def partition_dir(root, task):
+    return os.path.join(
+        root,
+        f"province={task['province_id']}",
+        f"district={task['district_id']}",
+        f"municipality={task['municipality_id']}",
+        f"ward={task['ward_id']}"
+    )
+
+
+def parse_partition(path):
+    partition = {}
+    for part in Path(path).parts:
+        key, sep, value = part.partition('=')
+        if sep and key in PARTITION_KEYS:
+            partition[key] = value
+    return partition
+
+
+def is_partitioned(root):
+    return any(Path(root).glob('province=*'))
+
+
+def load_municipalities(municipalities_file='municipalities.json'):
+    try:
+        with open(municipalities_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def resolve_ids(value, key, municipalities):
+    # accepts an id ('3'), a name ('इलाम') or the combo box text ('3 - इलाम')
+    # ids are only taken on trust when there is no list to check them against
+    value = str(value).strip()
+    id_ = value.split(' - ')[0]
+    if id_.isdigit():
+        if municipalities and id_ not in {str(m[f'{key}_id']) for m in municipalities}:
+            raise ValueError(f"No {key} with id {id_} in the municipalities list")
+        return {id_}
+    ids = {m[f'{key}_id'] for m in municipalities if value in (m[f'{key}_name'], m[key])}
+    if not ids:
+        raise ValueError(f"No {key} named '{value}' in the municipalities list")
+    return ids
+
+
+def list_partition_files(root, province=None, district=None, municipality=None, municipalities=None):
+    # only the matching partition folders are listed, the rest of the tree is never walked
+    filters = {'province': province, 'district': district, 'municipality': municipality}
+
+    if not is_partitioned(root):
+        if any(filters.values()):
+            raise ValueError(f"{root} is not partitioned; download with --layout partitioned to filter by region")
+        return list_csv_files(root)
+
+    municipalities = municipalities if municipalities is not None else load_municipalities()
+    patterns = ['']
+    for key in PARTITION_KEYS:
+        values = {'*'}
+        if filters.get(key):
+            values = resolve_ids(filters[key], key, municipalities)
+        patterns = [os.path.join(p, f"{key}={v}") for p in patterns for v in sorted(values)]
+
+    files = []
+    for pattern in patterns:
+        for directory in Path(root).glob(pattern):
+            files.extend(list_csv_files(directory))
+    return sorted(files)
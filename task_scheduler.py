@@ -0,0 +1,104 @@
+import json
+import os
+import statistics
+import threading
+from voter_snapshot import center_key
+
+
+COST_JOURNAL = 'task_costs.json'
+DEFAULT_COST = 1000
+# rough size of one voter row in the downloaded csv, used when only the file is known
+BYTES_PER_VOTER = 250
+
+
+def _names(value):
+    # '3 - इलाम' -> {'3 - इलाम', '3', 'इलाम'}
+    value = str(value)
+    return {value} | {part.strip() for part in value.split(' - ', 1)}
+
+
+class TaskScheduler:
+    # orders download tasks largest first, so the biggest polling centers
+    # don't end up as the long tail of a run
+    def __init__(self, journal_file=COST_JOURNAL, snapshot_dir=None, task_filepath=None, log=print):
+        self.journal_file = journal_file
+        self.task_filepath = task_filepath
+        self.log = log
+        self.lock = threading.Lock()
+
+        # voters per center from earlier runs
+        self.journal = {}
+        if os.path.exists(journal_file):
+            with open(journal_file, 'r', encoding='utf-8') as f:
+                self.journal = json.load(f)
+
+        self.known = dict(self.journal)
+        if snapshot_dir and os.path.exists(os.path.join(snapshot_dir, 'manifest.json')):
+            with open(os.path.join(snapshot_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+                for key, entry in json.load(f).items():
+                    self.known.setdefault(key, entry['rows'])
+
+    def estimate(self, task, fallback=None):
+        key = center_key(task)
+        if key in self.known:
+            return self.known[key]
+
+        if self.task_filepath:
+            filepath = self.task_filepath(task)
+            if os.path.exists(filepath):
+                return os.path.getsize(filepath) // BYTES_PER_VOTER
+
+        return fallback(task) if fallback else DEFAULT_COST
+
+    def _heuristic(self):
+        # unknown centers get the average of their ward, then municipality,
+        # then the overall median of known centers
+        wards = {}
+        municipalities = {}
+        for key, voters in self.known.items():
+            municipality_id, ward_id, _ = key.split('/')
+            wards.setdefault((municipality_id, ward_id), []).append(voters)
+            municipalities.setdefault(municipality_id, []).append(voters)
+        median = statistics.median(self.known.values()) if self.known else DEFAULT_COST
+
+        def fallback(task):
+            ward = wards.get((str(task['municipality_id']), str(task['ward_id'])))
+            if ward:
+                return sum(ward) / len(ward)
+            municipality = municipalities.get(str(task['municipality_id']))
+            if municipality:
+                return sum(municipality) / len(municipality)
+            return median
+
+        return fallback
+
+    def priority(self, task, priority_provinces=(), priority_districts=()):
+        district = _names(task['district_id']) | _names(task.get('district_name', ''))
+        if any(_names(d) & district for d in priority_districts):
+            return 2
+        province = _names(task['province_id']) | _names(task.get('province', ''))
+        if any(_names(p) & province for p in priority_provinces):
+            return 1
+        return 0
+
+    def order(self, tasks, priority_provinces=(), priority_districts=()):
+        fallback = self._heuristic()
+        costs = [self.estimate(task, fallback) for task in tasks]
+        order = sorted(
+            range(len(tasks)),
+            key=lambda i: (-self.priority(tasks[i], priority_provinces, priority_districts), -costs[i])
+        )
+
+        known = sum(1 for task in tasks if center_key(task) in self.known)
+        self.log(f"Scheduled {len(tasks)} tasks largest first ({known} with sizes from earlier runs)")
+        return [tasks[i] for i in order]
+
+    def record(self, task, voters):
+        with self.lock:
+            self.journal[center_key(task)] = voters
+
+    def save(self):
+        with self.lock:
+            with open(self.journal_file + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(self.journal, f)
+            os.replace(self.journal_file + '.tmp', self.journal_file)
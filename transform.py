@@ -1,13 +1,25 @@
 import pandas as pd
 import os
-from pathlib import Path
 import requests
 import argparse
+from transliterate import Transliterator, CACHE_FILE
+from voter_rollup import RollupAccumulator
+from voter_io import COMPRESSION_CHOICES, compressed_name, csv_stem, to_csv_options
+from partitions import list_partition_files, load_municipalities, parse_partition
 
 
 parser = argparse.ArgumentParser(description='Process voter data CSV files')
 parser.add_argument('--source', type=str, default='voter_data', help='Source folder containing CSV files of the voter data')
 parser.add_argument('--dest', type=str, default='voter_data_enhanced_english', help='Destination folder for processed files')
+parser.add_argument('--compression', type=str, default='none', choices=COMPRESSION_CHOICES, help='Compress the processed files (compressed source files are read as is)')
+parser.add_argument('--compression_level', type=int, default=None, help='Compression level (gzip/bz2: 1-9, xz: 0-9); codec default if not given')
+parser.add_argument('--romanize', action='store_true', help='Add romanized (Latin script) name and polling place columns')
+parser.add_argument('--translit_cache', type=str, default=CACHE_FILE, help='File to keep romanized names in between runs')
+parser.add_argument('--rollup_file', type=str, default=None, help='Also write voter counts by province/municipality/ward/sex/married/age band to this file (eg. voter_rollup.csv)')
+parser.add_argument('--province', type=str, default=None, help='Only process this province (id or name); needs a partitioned source folder')
+parser.add_argument('--district', type=str, default=None, help='Only process this district (id or name); needs a partitioned source folder')
+parser.add_argument('--municipality', type=str, default=None, help='Only process this municipality (id or name); needs a partitioned source folder')
+parser.add_argument('--input_json', type=str, default='municipalities.json', help='JSON file with the list of municipalities, used for names of partitioned folders')
 args = parser.parse_args()
 
 # src and dst
@@ -35,22 +47,44 @@ try:
 except Exception as e:
     print(f"Warning: Could not load from Gist ({e}). Proceeding without translations.")
 
-# get and process
-csv_files = list(Path(source_folder).glob('*.csv'))
+# romanized names, cached across files and runs
+transliterator = Transliterator(args.translit_cache) if args.romanize else None
+
+# summary counts, updated as each file is processed
+rollup = RollupAccumulator() if args.rollup_file else None
+
+# get and process (plain or compressed csv); partitioned folders are pruned by the filters
+municipalities = load_municipalities(args.input_json)
+municipalities_by_id = {m['municipality_id']: m for m in municipalities}
+try:
+    csv_files = list_partition_files(source_folder, args.province, args.district, args.municipality, municipalities)
+except ValueError as e:
+    parser.error(str(e))
 
 for csv_file in csv_files:
     print(f"Processing: {csv_file.name}")
     
-    filename = csv_file.stem
-    parts = filename.split('_')
-    
-    province = parts[0]
-    municipality = f"{parts[1]}_{parts[2]}"
-    ward_no = parts[3]
-    polling_place = '_'.join(parts[4:]) if len(parts) > 4 else ''
+    filename = csv_stem(csv_file)
+    relative_dir = os.path.relpath(csv_file.parent, source_folder)
+    partition = parse_partition(relative_dir)
     
-    municipality = municipality.replace('_', ' ')
-    polling_place = polling_place.replace('_', ' ')
+    if partition:
+        # ids from the folders, file is {municipality}_{ward}_{polling place}
+        mun = municipalities_by_id.get(partition['municipality'], {})
+        province = mun.get('province_name', partition['province'])
+        municipality = mun.get('municipality_name', partition['municipality'])
+        ward_no = partition['ward']
+        polling_place = filename.split('_', 2)[-1]
+    else:
+        parts = filename.split('_')
+        
+        province = parts[0]
+        municipality = f"{parts[1]}_{parts[2]}"
+        ward_no = parts[3]
+        polling_place = '_'.join(parts[4:]) if len(parts) > 4 else ''
+        
+        municipality = municipality.replace('_', ' ')
+        polling_place = polling_place.replace('_', ' ')
     
     # not in gist, copy as is
     municipality_en = municipality_translation.get(municipality, municipality)
@@ -69,6 +103,12 @@ for csv_file in csv_files:
     df['Husband/Wife Name'] = df['पति/पत्नीको नाम']
     df['Father/Mother Name'] = df['पिता/माताको नाम']
     
+    if transliterator:
+        df.insert(5, 'Polling Place_en', transliterator.text(polling_place))
+        df['Voter Name_en'] = transliterator.series(df['Voter Name'])
+        df['Husband/Wife Name_en'] = transliterator.series(df['Husband/Wife Name'])
+        df['Father/Mother Name_en'] = transliterator.series(df['Father/Mother Name'])
+    
     df['Married'] = df['पति/पत्नीको नाम'].apply(
         lambda x: 'N' if (x == '-' or x == '' or pd.isna(x)) else 'Y'
     )
@@ -77,8 +117,21 @@ for csv_file in csv_files:
         lambda x: 'M' if x == 'पुरुष' else "F"
     )
 
-    output_path = os.path.join(dest_folder, csv_file.name)
-    df.to_csv(output_path, index=False)
+    if rollup:
+        rollup.add(df)
+
+    # keep the partition folders in the destination
+    output_path = os.path.join(dest_folder, relative_dir, compressed_name(f"{filename}.csv", args.compression))
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    df.to_csv(output_path, index=False, **to_csv_options(args.compression, args.compression_level))
     print(f"Saved: {output_path}")
 
+if transliterator:
+    transliterator.save()
+    print(f"Romanized {len(transliterator.cache) - transliterator.loaded} new names ({len(transliterator.cache)} cached in {args.translit_cache})")
+
+if rollup:
+    rollup.write(args.rollup_file)
+    print(f"Saved voter counts: {args.rollup_file}")
+
 print(f"\nAll files processed. Total: {len(csv_files)}")
\ No newline at end of file
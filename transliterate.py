@@ -0,0 +1,141 @@
+import json
+import os
+import unicodedata
+import numpy as np
+import pandas as pd
+
+
+CACHE_FILE = 'transliteration_cache.json'
+
+# Nepali name style romanization (Ram Bahadur, Sita Kumari), not strict IAST
+CONSONANTS = {
+    'क': 'k', 'ख': 'kh', 'ग': 'g', 'घ': 'gh', 'ङ': 'ng',
+    'च': 'ch', 'छ': 'chh', 'ज': 'j', 'झ': 'jh', 'ञ': 'ny',
+    'ट': 't', 'ठ': 'th', 'ड': 'd', 'ढ': 'dh', 'ण': 'n',
+    'त': 't', 'थ': 'th', 'द': 'd', 'ध': 'dh', 'न': 'n',
+    'प': 'p', 'फ': 'ph', 'ब': 'b', 'भ': 'bh', 'म': 'm',
+    'य': 'y', 'र': 'r', 'ल': 'l', 'व': 'v', 'श': 'sh',
+    'ष': 'sh', 'स': 's', 'ह': 'h',
+    'ड़': 'd', 'ढ़': 'dh', 'क़': 'k', 'ख़': 'kh', 'ग़': 'g', 'ज़': 'z', 'फ़': 'f'
+}
+VOWELS = {
+    'अ': 'a', 'आ': 'a', 'इ': 'i', 'ई': 'i', 'उ': 'u', 'ऊ': 'u',
+    'ऋ': 'ri', 'ए': 'e', 'ऐ': 'ai', 'ओ': 'o', 'औ': 'au'
+}
+VOWEL_SIGNS = {
+    'ा': 'a', 'ि': 'i', 'ी': 'i', 'ु': 'u', 'ू': 'u', 'ृ': 'ri',
+    'े': 'e', 'ै': 'ai', 'ो': 'o', 'ौ': 'au'
+}
+# conjuncts with a settled spelling in names
+CONJUNCTS = {
+    'क्ष': 'ksh',
+    'ज्ञ': 'gy',
+    'ङ्ग': 'ng',
+    'ञ्ज': 'nj',
+    'ञ्च': 'nch',
+    'ष्ठ': 'sth',
+    'श्र': 'shr'
+}
+# nukta letters are kept decomposed (ड + ़) by NFC
+CONSONANTS = {unicodedata.normalize('NFC', k): v for k, v in CONSONANTS.items()}
+NASALS = {'ं': 'n', 'ँ': 'n'}
+VISARGA = 'ः'
+VIRAMA = '्'
+NUKTA = '़'
+DIGITS = str.maketrans('०१२३४५६७८९', '0123456789')
+
+
+def romanize_word(word):
+    # walks the word letter by letter; a consonant carries an inherent 'a'
+    # unless a vowel sign or virama follows, and the final inherent 'a' is
+    # dropped (राम -> ram) except after a conjunct (कृष्ण -> krishna)
+    word = unicodedata.normalize('NFC', word).translate(DIGITS)
+    out = []
+    inherent = False
+    final_cluster = False
+    i = 0
+    while i < len(word):
+        if word[i:i + 3] in CONJUNCTS:
+            chars, letter, size = word[i:i + 3], CONJUNCTS[word[i:i + 3]], 3
+        elif word[i:i + 2] in CONSONANTS:
+            chars, letter, size = word[i:i + 2], CONSONANTS[word[i:i + 2]], 2
+        else:
+            chars, letter, size = word[i], None, 1
+
+        ch = chars[0]
+        if letter is not None or ch in CONSONANTS:
+            if inherent:
+                out.append('a')
+            final_cluster = size == 3 or (i > 0 and word[i - 1] == VIRAMA)
+            out.append(letter or CONSONANTS[ch])
+            inherent = True
+        elif ch in VOWEL_SIGNS:
+            out.append(VOWEL_SIGNS[ch])
+            inherent = False
+        elif ch == VIRAMA:
+            inherent = False
+        elif ch in VOWELS:
+            if inherent:
+                out.append('a')
+            out.append(VOWELS[ch])
+            inherent = False
+        elif ch in NASALS:
+            if inherent:
+                out.append('a')
+                inherent = False
+            following = CONSONANTS.get(word[i + 1:i + 2], '')
+            out.append('m' if following and following[0] in 'pbm' else NASALS[ch])
+        elif ch == VISARGA:
+            if inherent:
+                out.append('a')
+                inherent = False
+            out.append('h')
+        elif ch == NUKTA:
+            pass
+        else:
+            if inherent:
+                out.append('a')
+                inherent = False
+            out.append(ch)
+        i += size
+
+    if inherent and (final_cluster or len(out) == 1):
+        out.append('a')
+
+    roman = ''.join(out)
+    return roman[:1].upper() + roman[1:]
+
+
+class Transliterator:
+    # names repeat a lot, so every word is romanized once and kept in a
+    # cache that is saved between runs
+    def __init__(self, cache_file=CACHE_FILE):
+        self.cache_file = cache_file
+        self.cache = {}
+        if cache_file and os.path.exists(cache_file):
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                self.cache = json.load(f)
+        self.loaded = len(self.cache)
+
+    def word(self, word):
+        roman = self.cache.get(word)
+        if roman is None:
+            roman = self.cache[word] = romanize_word(word)
+        return roman
+
+    def text(self, text):
+        return ' '.join(self.word(w) for w in str(text).split())
+
+    def series(self, series):
+        # romanize only the unique values, then map back by their codes
+        # (missing values get code -1, which picks the trailing None)
+        codes, uniques = pd.factorize(series)
+        romanized = np.array([self.text(u) for u in uniques] + [None], dtype=object)
+        return pd.Series(romanized[codes], index=series.index)
+
+    def save(self):
+        if not self.cache_file:
+            return
+        with open(self.cache_file + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.cache, f, ensure_ascii=False)
+        os.replace(self.cache_file + '.tmp', self.cache_file)
@@ -0,0 +1,239 @@
+import sqlite3
+import threading
+import queue
+from voter_io import iter_csv_rows
+
+
+DB_FILE = 'voter_data.db'
+BATCH_SIZE = 5000
+FLUSH_INTERVAL = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS province (
+    province_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS district (
+    district_id INTEGER PRIMARY KEY,
+    province_id INTEGER NOT NULL REFERENCES province(province_id),
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS municipality (
+    municipality_id INTEGER PRIMARY KEY,
+    district_id INTEGER NOT NULL REFERENCES district(district_id),
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ward (
+    municipality_id INTEGER NOT NULL REFERENCES municipality(municipality_id),
+    ward_id INTEGER NOT NULL,
+    name TEXT,
+    PRIMARY KEY (municipality_id, ward_id)
+);
+CREATE TABLE IF NOT EXISTS reg_center (
+    municipality_id INTEGER NOT NULL,
+    ward_id INTEGER NOT NULL,
+    reg_center_id INTEGER NOT NULL,
+    name TEXT,
+    voter_count INTEGER,
+    PRIMARY KEY (municipality_id, ward_id, reg_center_id),
+    FOREIGN KEY (municipality_id, ward_id) REFERENCES ward(municipality_id, ward_id)
+);
+CREATE TABLE IF NOT EXISTS voters (
+    municipality_id INTEGER NOT NULL,
+    ward_id INTEGER NOT NULL,
+    reg_center_id INTEGER NOT NULL,
+    serial_no TEXT,
+    voter_no TEXT,
+    name TEXT,
+    age TEXT,
+    gender TEXT,
+    spouse_name TEXT,
+    parent_name TEXT,
+    details TEXT,
+    FOREIGN KEY (municipality_id, ward_id, reg_center_id)
+        REFERENCES reg_center(municipality_id, ward_id, reg_center_id)
+);
+CREATE INDEX IF NOT EXISTS idx_voters_center ON voters(municipality_id, ward_id, reg_center_id);
+CREATE INDEX IF NOT EXISTS idx_voters_voter_no ON voters(voter_no);
+CREATE INDEX IF NOT EXISTS idx_voters_name ON voters(name);
+CREATE INDEX IF NOT EXISTS idx_district_province ON district(province_id);
+CREATE INDEX IF NOT EXISTS idx_municipality_district ON municipality(district_id);
+"""
+
+# csv header -> voters column
+VOTER_COLUMNS = {
+    'सि.नं.': 'serial_no',
+    'मतदाता नं': 'voter_no',
+    'मतदाताको नाम': 'name',
+    'उमेर(वर्ष)': 'age',
+    'लिङ्ग': 'gender',
+    'पति/पत्नीको नाम': 'spouse_name',
+    'पिता/माताको नाम': 'parent_name',
+    'मतदाता विवरण': 'details'
+}
+
+_STOP = object()
+
+
+def geography_name(record, key):
+    # municipalities.json has '<key>_name'; failed.json records only have '<key>',
+    # which can be the combo box text ('3 - इलाम') or empty
+    name = record.get(f'{key}_name') or record.get(key) or ''
+    prefix = f"{record.get(f'{key}_id')} - "
+    return name[len(prefix):] if name.startswith(prefix) else name
+
+
+class VoterDatabase:
+    # all writes go through a queue to one writer thread, so download workers
+    # never wait on sqlite locks; reads can use their own connection
+    def __init__(self, db_file=DB_FILE, batch_size=BATCH_SIZE, log=print):
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.log = log
+        self.queue = queue.Queue(maxsize=64)
+        self.error = None
+
+        conn = sqlite3.connect(self.db_file)
+        conn.executescript(SCHEMA)
+        conn.close()
+
+        self.writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self.writer.start()
+
+    def load_geography(self, municipalities_data):
+        provinces = {}
+        districts = {}
+        municipalities = []
+        for m in municipalities_data:
+            # names that are missing (eg. records from failed.json) are left as they are
+            province_name = geography_name(m, 'province')
+            district_name = geography_name(m, 'district')
+            if province_name:
+                provinces[int(m['province_id'])] = province_name
+            if district_name:
+                districts[int(m['district_id'])] = (int(m['province_id']), district_name)
+            municipalities.append((int(m['municipality_id']), int(m['district_id']), geography_name(m, 'municipality')))
+
+        self.queue.put(('geography', (
+            list(provinces.items()),
+            [(d_id, p_id, name) for d_id, (p_id, name) in districts.items()],
+            municipalities
+        )))
+
+    def write_voters(self, task, voters_record, replace=True):
+        # voters_record is the list of row dicts from get_table_rows; a large
+        # center can come in several batches, only the first replaces its voters
+        center = (
+            int(task['municipality_id']),
+            int(task['ward_id']),
+            int(task['reg_center_id'])
+        )
+        rows = [
+            center + tuple(row.get(header, '') for header in VOTER_COLUMNS)
+            for row in voters_record
+        ]
+        self.queue.put(('center' if replace else 'rows', (task, center, rows)))
+
+    def write_voters_file(self, task, filepath):
+        # streamed downloads: the center's csv is read back in batches
+        batch = []
+        first = True
+        for row in iter_csv_rows(filepath):
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self.write_voters(task, batch, replace=first)
+                batch = []
+                first = False
+        if batch or first:
+            self.write_voters(task, batch, replace=first)
+
+    def close(self):
+        self.queue.put(_STOP)
+        self.writer.join()
+        if self.error:
+            self.log(f"Database writer failed: {self.error}")
+
+    def _writer_loop(self):
+        conn = sqlite3.connect(self.db_file)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+
+        pending = []
+        pending_rows = 0
+        stop = False
+
+        while not stop:
+            try:
+                item = self.queue.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                stop = True
+            elif item is not None:
+                pending.append(item)
+                if item[0] in ('center', 'rows'):
+                    pending_rows += len(item[1][2])
+
+            # flush on size, on idle, or on close
+            if pending and (stop or item is None or pending_rows >= self.batch_size):
+                try:
+                    self._flush(conn, pending)
+                except Exception as e:
+                    conn.rollback()
+                    self.error = e
+                    self.log(f"Database write error: {e}")
+                pending = []
+                pending_rows = 0
+
+        conn.close()
+
+    def _flush(self, conn, pending):
+        with conn:
+            for kind, payload in pending:
+                if kind == 'geography':
+                    provinces, districts, municipalities = payload
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO province (province_id, name) VALUES (?, ?)',
+                        provinces)
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO district (district_id, province_id, name) VALUES (?, ?, ?)',
+                        districts)
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO municipality (municipality_id, district_id, name) VALUES (?, ?, ?)',
+                        municipalities)
+
+                elif kind == 'center':
+                    task, center, rows = payload
+                    conn.execute(
+                        'INSERT OR IGNORE INTO municipality (municipality_id, district_id, name) VALUES (?, ?, ?)',
+                        (center[0], int(task['district_id']), task['municipality_name']))
+                    conn.execute(
+                        'INSERT OR REPLACE INTO ward (municipality_id, ward_id, name) VALUES (?, ?, ?)',
+                        (center[0], center[1], task.get('ward_name', '')))
+                    conn.execute(
+                        'INSERT OR REPLACE INTO reg_center '
+                        '(municipality_id, ward_id, reg_center_id, name, voter_count) VALUES (?, ?, ?, ?, ?)',
+                        center + (task['reg_center_name'], len(rows)))
+
+                    # re-downloads replace the center's voters
+                    conn.execute(
+                        'DELETE FROM voters WHERE municipality_id = ? AND ward_id = ? AND reg_center_id = ?',
+                        center)
+                    conn.executemany(
+                        'INSERT INTO voters (municipality_id, ward_id, reg_center_id, serial_no, voter_no, '
+                        'name, age, gender, spouse_name, parent_name, details) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        rows)
+
+                elif kind == 'rows':
+                    task, center, rows = payload
+                    conn.executemany(
+                        'INSERT INTO voters (municipality_id, ward_id, reg_center_id, serial_no, voter_no, '
+                        'name, age, gender, spouse_name, parent_name, details) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        rows)
+                    conn.execute(
+                        'UPDATE reg_center SET voter_count = voter_count + ? '
+                        'WHERE municipality_id = ? AND ward_id = ? AND reg_center_id = ?',
+                        (len(rows),) + center)
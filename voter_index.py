@@ -0,0 +1,422 @@
+import argparse
+import csv
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import unicodedata
+from array import array
+from pathlib import Path
+import numpy as np
+from voter_io import csv_stem, infer_compression
+from partitions import list_partition_files, parse_partition
+
+
+INDEX_DIR = 'voter_index'
+NGRAM_SIZE = 2
+
+VOTER_NO_COLUMNS = ['मतदाता नं']
+NAME_COLUMNS = ['मतदाताको नाम', 'Voter Name']
+
+# geography columns added by transform.py
+GEOGRAPHY_COLUMNS = {
+    'province': 'Province',
+    'municipality': 'Municipality/Village',
+    'ward': 'Ward No.',
+    'polling_place': 'Polling Place'
+}
+
+# on-disk record layouts (little endian, fixed width so they can be mmap'd)
+ROW_RECORD = struct.Struct('<IQ')        # file_id, byte offset of the row
+VOTER_RECORD = struct.Struct('<QI')      # voter no, row_id
+NGRAM_RECORD = struct.Struct('<QQI')     # gram hash, postings start, postings count
+POSTING_RECORD = struct.Struct('<I')     # row_id
+
+DEVANAGARI_DIGITS = str.maketrans('०१२३४५६७८९', '0123456789')
+
+# marks that attach to the previous letter: candrabindu/anusvara/visarga,
+# nukta, vowel signs, virama and the vocalic vowel signs
+DEVANAGARI_MARKS = set(
+    [chr(c) for c in range(0x0900, 0x0904)]
+    + ['ऺ', 'ऻ', '़']
+    + [chr(c) for c in range(0x093e, 0x0950)]
+    + [chr(c) for c in range(0x0951, 0x0958)]
+    + ['ॢ', 'ॣ']
+)
+VIRAMA = '्'
+JOINERS = {'‌', '‍'}
+
+
+def normalize_name(name):
+    name = unicodedata.normalize('NFC', str(name))
+    name = ''.join(ch for ch in name if ch not in JOINERS)
+    return ' '.join(name.casefold().split())
+
+
+def parse_voter_no(value):
+    value = str(value).strip().translate(DEVANAGARI_DIGITS)
+    return int(value) if value.isdigit() else None
+
+
+def split_aksharas(word):
+    # split a word into aksharas, so a vowel sign or a half letter never ends
+    # up in a different gram than the consonant it belongs to (eg. क्ष, श्री)
+    aksharas = []
+    for ch in word:
+        if aksharas and (ch in DEVANAGARI_MARKS or aksharas[-1].endswith(VIRAMA)):
+            aksharas[-1] += ch
+        else:
+            aksharas.append(ch)
+    return aksharas
+
+
+def name_ngrams(name, n=NGRAM_SIZE):
+    grams = set()
+    for word in normalize_name(name).split():
+        # words shorter than a gram are left to the final name check
+        aksharas = split_aksharas(word)
+        for i in range(len(aksharas) - n + 1):
+            grams.add(''.join(aksharas[i:i + n]))
+    return grams
+
+
+def gram_hash(gram):
+    return int.from_bytes(hashlib.blake2b(gram.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def load_municipality_lookup(municipalities_file='municipalities.json'):
+    try:
+        with open(municipalities_file, 'r', encoding='utf-8') as f:
+            return {m['municipality_name']: m for m in json.load(f)}
+    except FileNotFoundError:
+        return {}
+
+
+def file_geography(csv_file, municipality_lookup):
+    # downloader file names are {municipality}_{ward}_{reg center}
+    parts = csv_stem(csv_file).split('_')
+    if len(parts) < 3:
+        return {}
+
+    municipality = parts[0]
+    geography = {
+        'municipality': municipality,
+        'ward': parts[1],
+        'polling_place': '_'.join(parts[2:])
+    }
+    # ids from partitioned folders (province=/district=/municipality=/ward=)
+    for key, value in parse_partition(Path(csv_file).parent).items():
+        geography[f'{key}_id'] = value
+
+    mun = municipality_lookup.get(municipality)
+    if mun:
+        geography['province'] = mun['province_name']
+        geography['district'] = mun['district_name']
+    return geography
+
+
+def list_source_files(source):
+    source = Path(source)
+    if source.is_file():
+        return [source]
+    return list_partition_files(source)
+
+
+def find_column(header, candidates):
+    for name in candidates:
+        if name in header:
+            return header.index(name)
+    return None
+
+
+def iter_rows_with_offsets(csv_file):
+    # yields (byte offset, parsed row); offsets let queries seek straight to a row
+    with open(csv_file, 'rb') as f:
+        header_line = f.readline()
+        header = next(csv.reader([header_line.decode('utf-8-sig')]))
+        yield None, header
+
+        offset = f.tell()
+        for line in f:
+            text = line.decode('utf-8').rstrip('\r\n')
+            if text:
+                yield offset, next(csv.reader([text]))
+            offset += len(line)
+
+
+def write_records(path, record, items):
+    with open(path, 'wb') as f:
+        for item in items:
+            f.write(record.pack(*item))
+
+
+def check_uncompressed(paths):
+    # a seek into gzip/bz2/xz decompresses again from the start of the file,
+    # which turns a millisecond lookup into seconds on large files
+    compressed = [str(p) for p in paths if infer_compression(p) != 'none']
+    if compressed:
+        raise ValueError(f"{len(compressed)} compressed files (eg. {compressed[0]}) can not be indexed; "
+                         f"index the uncompressed files (eg. transform.py/create_single_file.py --compression none)")
+
+
+def build_index(source, index_dir=INDEX_DIR, municipalities_file='municipalities.json', log=print):
+    start = time.time()
+    source_files = list_source_files(source)
+    check_uncompressed(source_files)
+    os.makedirs(index_dir, exist_ok=True)
+    municipality_lookup = load_municipality_lookup(municipalities_file)
+
+    files = []
+    # (voter no, row_id) pairs as two flat arrays, 12 bytes per voter
+    voter_nos = array('Q')
+    voter_rows = array('I')
+    postings = {}
+    row_id = 0
+
+    with open(os.path.join(index_dir, 'rows.bin'), 'wb') as rows_out:
+        for file_id, csv_file in enumerate(source_files):
+            rows = iter_rows_with_offsets(csv_file)
+            _, header = next(rows)
+            voter_no_col = find_column(header, VOTER_NO_COLUMNS)
+            name_col = find_column(header, NAME_COLUMNS)
+
+            files.append({
+                'path': os.path.abspath(csv_file),
+                'header': header,
+                'geography': file_geography(csv_file, municipality_lookup)
+            })
+
+            for offset, row in rows:
+                rows_out.write(ROW_RECORD.pack(file_id, offset))
+
+                if voter_no_col is not None and voter_no_col < len(row):
+                    voter_no = parse_voter_no(row[voter_no_col])
+                    if voter_no is not None:
+                        voter_nos.append(voter_no)
+                        voter_rows.append(row_id)
+
+                if name_col is not None and name_col < len(row):
+                    for gram in name_ngrams(row[name_col]):
+                        key = gram_hash(gram)
+                        if key not in postings:
+                            postings[key] = array('I')
+                        postings[key].append(row_id)
+
+                row_id += 1
+
+            log(f"Indexed: {Path(csv_file).name}")
+
+    # row ids are already increasing, so a stable sort on the voter no gives
+    # the same order as sorting the pairs
+    order = np.argsort(np.frombuffer(voter_nos, dtype=np.uint64), kind='stable')
+    voter_records = np.empty(len(order), dtype=[('voter_no', '<u8'), ('row_id', '<u4')])
+    voter_records['voter_no'] = np.frombuffer(voter_nos, dtype=np.uint64)[order]
+    voter_records['row_id'] = np.frombuffer(voter_rows, dtype=np.uint32)[order]
+    del voter_nos, voter_rows, order
+    voter_records.tofile(os.path.join(index_dir, 'voter_no.bin'))
+    del voter_records
+
+    # postings are already in row order, so each list is sorted
+    keys = []
+    with open(os.path.join(index_dir, 'ngram_postings.bin'), 'wb') as f:
+        position = 0
+        for key in sorted(postings):
+            posting = postings[key]
+            if sys.byteorder != 'little':
+                posting.byteswap()
+            f.write(posting.tobytes())
+            keys.append((key, position, len(posting)))
+            position += len(posting)
+    write_records(os.path.join(index_dir, 'ngram_keys.bin'), NGRAM_RECORD, keys)
+
+    with open(os.path.join(index_dir, 'files.json'), 'w', encoding='utf-8') as f:
+        json.dump({'ngram_size': NGRAM_SIZE, 'rows': row_id, 'files': files}, f, ensure_ascii=False)
+
+    log(f"Indexed {row_id} rows from {len(files)} files in {time.time() - start:.1f}s -> {index_dir}")
+
+
+class RecordFile:
+    # read-only, memory-mapped array of fixed width records
+    def __init__(self, path, record):
+        self.record = record
+        self.file = open(path, 'rb')
+        size = os.path.getsize(path)
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.count = size // record.size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return self.record.unpack_from(self.map, i * self.record.size)
+
+    def lower_bound(self, key):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self[mid][0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def close(self):
+        if self.count:
+            self.map.close()
+        self.file.close()
+
+
+class VoterIndex:
+    def __init__(self, index_dir=INDEX_DIR):
+        with open(os.path.join(index_dir, 'files.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.ngram_size = meta['ngram_size']
+        self.files = meta['files']
+        check_uncompressed(f['path'] for f in self.files)
+        self.rows = RecordFile(os.path.join(index_dir, 'rows.bin'), ROW_RECORD)
+        self.voter_nos = RecordFile(os.path.join(index_dir, 'voter_no.bin'), VOTER_RECORD)
+        self.ngram_keys = RecordFile(os.path.join(index_dir, 'ngram_keys.bin'), NGRAM_RECORD)
+        self.postings = RecordFile(os.path.join(index_dir, 'ngram_postings.bin'), POSTING_RECORD)
+        self.handles = {}
+
+    def close(self):
+        for f in self.handles.values():
+            f.close()
+        for records in (self.rows, self.voter_nos, self.ngram_keys, self.postings):
+            records.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def find_by_voter_no(self, voter_no):
+        voter_no = parse_voter_no(voter_no)
+        if voter_no is None:
+            return []
+
+        results = []
+        i = self.voter_nos.lower_bound(voter_no)
+        while i < len(self.voter_nos):
+            key, row_id = self.voter_nos[i]
+            if key != voter_no:
+                break
+            results.append(self.read_row(row_id))
+            i += 1
+        return results
+
+    def find_by_name(self, name, limit=50):
+        query = normalize_name(name)
+        grams = name_ngrams(query, self.ngram_size)
+        if not grams:
+            raise ValueError(f"Name query needs a word of at least {self.ngram_size} aksharas (eg. राम, not श्रे)")
+
+        # intersect the smallest posting lists first
+        lists = []
+        for gram in grams:
+            key = gram_hash(gram)
+            i = self.ngram_keys.lower_bound(key)
+            if i >= len(self.ngram_keys) or self.ngram_keys[i][0] != key:
+                return []
+            _, start, count = self.ngram_keys[i]
+            lists.append((count, start))
+        lists.sort()
+
+        count, start = lists[0]
+        candidates = self.posting_list(start, count)
+        for count, start in lists[1:]:
+            posting = set(self.posting_list(start, count))
+            candidates = [r for r in candidates if r in posting]
+            if not candidates:
+                return []
+
+        # grams can collide or appear in a different order, check the actual name
+        results = []
+        for row_id in candidates:
+            row = self.read_row(row_id)
+            row_name = next((row[c] for c in NAME_COLUMNS if c in row), '')
+            if query in normalize_name(row_name):
+                results.append(row)
+                if len(results) >= limit:
+                    break
+        return results
+
+    def posting_list(self, start, count):
+        size = POSTING_RECORD.size
+        posting = array('I', self.postings.map[start * size:(start + count) * size])
+        if sys.byteorder != 'little':
+            posting.byteswap()
+        return posting
+
+    def read_row(self, row_id):
+        file_id, offset = self.rows[row_id]
+        info = self.files[file_id]
+
+        f = self.handles.get(file_id)
+        if f is None:
+            f = self.handles[file_id] = open(info['path'], 'rb')
+        f.seek(offset)
+        values = next(csv.reader([f.readline().decode('utf-8').rstrip('\r\n')]))
+
+        row = dict(info['geography'])
+        row.update(zip(info['header'], values))
+        for key, column in GEOGRAPHY_COLUMNS.items():
+            if column in row:
+                row[key] = row[column]
+        row['source_file'] = info['path']
+        return row
+
+
+def print_rows(rows, elapsed):
+    for row in rows:
+        location = ' / '.join(str(row.get(k, '')) for k in ('province', 'municipality', 'ward', 'polling_place'))
+        print(f"{row.get('मतदाता नं', '')}\t{row.get('मतदाताको नाम', row.get('Voter Name', ''))}\t"
+              f"{row.get('उमेर(वर्ष)', '')}\t{location}")
+    print(f"\n{len(rows)} match(es) in {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build and query a voter number / name index over downloaded voter data')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Build the index')
+    build_parser.add_argument('--source', type=str, default='voter_data', help='Folder of CSV files (downloaded or transformed) or the consolidated CSV file')
+    build_parser.add_argument('--index', type=str, default=INDEX_DIR, help='Folder to write the index to')
+    build_parser.add_argument('--input_json', type=str, default='municipalities.json', help='JSON file with the list of municipalities, used to fill in district/province')
+
+    query_parser = subparsers.add_parser('query', help='Look up voters in the index')
+    query_parser.add_argument('--index', type=str, default=INDEX_DIR, help='Folder containing the index')
+    query_parser.add_argument('--voter_no', type=str, help='Voter number (मतदाता नं) to look up')
+    query_parser.add_argument('--name', type=str, help='Full or partial voter name')
+    query_parser.add_argument('--limit', type=int, default=50, help='Maximum number of name matches')
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        try:
+            build_index(args.source, args.index, args.input_json)
+        except ValueError as e:
+            build_parser.error(str(e))
+    else:
+        if not args.voter_no and not args.name:
+            query_parser.error('give --voter_no or --name')
+
+        try:
+            index = VoterIndex(args.index)
+        except ValueError as e:
+            query_parser.error(str(e))
+
+        with index:
+            start = time.time()
+            if args.voter_no:
+                rows = index.find_by_voter_no(args.voter_no)
+            else:
+                try:
+                    rows = index.find_by_name(args.name, args.limit)
+                except ValueError as e:
+                    query_parser.error(str(e))
+            print_rows(rows, time.time() - start)
@@ -0,0 +1,215 @@
+import argparse
+import csv
+import hashlib
+import math
+import os
+import statistics
+import time
+from pathlib import Path
+from partitions import list_partition_files, load_municipalities
+from voter_io import infer_compression, open_csv
+
+
+REPORT_DIR = 'integrity_report'
+FALSE_POSITIVE_RATE = 0.001
+# sizing from file sizes assumes short rows; over-estimating only costs memory
+# (~1.8 MB per million voters), under-estimating floods the exact pass
+MIN_BYTES_PER_VOTER = 60
+MIN_EXPECTED = 1000000
+# centers smaller/larger than this share of the median center size are flagged
+SMALL_CENTER = 0.1
+LARGE_CENTER = 10
+
+VOTER_NO = 'मतदाता नं'
+SERIAL_NO = 'सि.नं.'
+DEVANAGARI_DIGITS = str.maketrans('०१२३४५६७८९', '0123456789')
+
+
+class BloomFilter:
+    # fixed size bit array; "maybe seen" answers are confirmed by a second, exact pass
+    def __init__(self, expected, false_positive_rate=FALSE_POSITIVE_RATE):
+        expected = max(expected, 1)
+        self.size = int(-expected * math.log(false_positive_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / expected * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        # returns True if the value may have been added before
+        seen = True
+        for position in self._positions(value):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                seen = False
+                self.bits[byte] |= 1 << bit
+        return seen
+
+
+def iter_voters(csv_file):
+    # (voter no, serial no) per row, streamed
+    with open_csv(csv_file, 'rt', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        voter_col = header.index(VOTER_NO) if VOTER_NO in header else None
+        serial_col = header.index(SERIAL_NO) if SERIAL_NO in header else None
+        for row in reader:
+            voter_no = row[voter_col].strip().translate(DEVANAGARI_DIGITS) if voter_col is not None and voter_col < len(row) else ''
+            serial_no = row[serial_col].strip().translate(DEVANAGARI_DIGITS) if serial_col is not None and serial_col < len(row) else ''
+            yield voter_no, serial_no
+
+
+def estimate_voters(files):
+    total = 0
+    for csv_file in files:
+        size = os.path.getsize(csv_file)
+        # compressed voter lists are roughly 5x smaller
+        total += size * 5 if infer_compression(csv_file) != 'none' else size
+    return total // MIN_BYTES_PER_VOTER
+
+
+def serial_gaps(serials):
+    numbers = sorted(int(s) for s in serials if s.isdigit())
+    if not numbers:
+        return [], 0, 0
+    seen = set(numbers)
+    missing = [n for n in range(1, numbers[-1] + 1) if n not in seen]
+    repeated = len(numbers) - len(seen)
+    return missing, numbers[-1], repeated
+
+
+def check_integrity(files, source, report_dir=REPORT_DIR, expected=None, log=print):
+    start = time.time()
+    expected = max(expected or estimate_voters(files), MIN_EXPECTED)
+    bloom = BloomFilter(expected)
+    log(f"Checking {len(files)} files (bloom filter for ~{expected} voters, {len(bloom.bits) / 1024 ** 2:.1f} MB)")
+
+    # pass 1: per center checks, and voter numbers that may repeat
+    candidates = set()
+    centers = []
+    for csv_file in files:
+        rows = 0
+        blank = 0
+        serials = []
+        for voter_no, serial_no in iter_voters(csv_file):
+            rows += 1
+            serials.append(serial_no)
+            if not voter_no:
+                blank += 1
+            elif bloom.add(voter_no):
+                candidates.add(voter_no)
+
+        missing, max_serial, repeated = serial_gaps(serials)
+        centers.append({
+            'file': os.path.relpath(csv_file, source) if Path(source).is_dir() else str(csv_file),
+            'rows': rows,
+            'max_serial': max_serial,
+            'missing_serials': len(missing),
+            'missing_serial_list': ' '.join(str(n) for n in missing[:50]),
+            'repeated_serials': repeated,
+            'blank_voter_numbers': blank
+        })
+
+    # pass 2: exact counts, only for the candidates
+    locations = {}
+    if candidates:
+        for csv_file, center in zip(files, centers):
+            for voter_no, serial_no in iter_voters(csv_file):
+                if voter_no in candidates:
+                    locations.setdefault(voter_no, []).append((center['file'], serial_no))
+
+    # numbers in more than one center, and numbers repeated inside one center
+    duplicates = {}
+    repeats = []
+    for voter_no, places in locations.items():
+        by_center = {}
+        for file, serial_no in places:
+            by_center.setdefault(file, []).append(serial_no)
+        if len(by_center) > 1:
+            duplicates[voter_no] = by_center
+        for file, serial_nos in by_center.items():
+            if len(serial_nos) > 1:
+                repeats.append((voter_no, file, serial_nos))
+
+    # row count anomalies
+    median = statistics.median(c['rows'] for c in centers) if centers else 0
+    for center in centers:
+        anomalies = []
+        if center['rows'] == 0:
+            anomalies.append('empty')
+        if center['rows'] != center['max_serial']:
+            anomalies.append('rows_differ_from_last_serial')
+        if median and center['rows'] < median * SMALL_CENTER:
+            anomalies.append('unusually_small')
+        if median and center['rows'] > median * LARGE_CENTER:
+            anomalies.append('unusually_large')
+        if center['missing_serials'] or center['repeated_serials']:
+            anomalies.append('serial_gaps_or_repeats')
+        center['duplicate_voters'] = 0
+        center['repeated_voter_numbers'] = 0
+        center['anomalies'] = anomalies
+
+    by_file = {c['file']: c for c in centers}
+    for by_center in duplicates.values():
+        for file in by_center:
+            by_file[file]['duplicate_voters'] += 1
+    for _, file, _ in repeats:
+        by_file[file]['repeated_voter_numbers'] += 1
+
+    for center in centers:
+        if center['repeated_voter_numbers']:
+            center['anomalies'].append('repeated_voter_numbers')
+        center['anomalies'] = ' '.join(center['anomalies'])
+
+    write_report(report_dir, centers, duplicates, repeats)
+    false_positives = sum(1 for places in locations.values() if len(places) == 1)
+    log(f"{len(duplicates)} voter numbers in more than one center, {len(repeats)} repeated within a center "
+        f"({false_positives} bloom false positives), "
+        f"{sum(1 for c in centers if c['anomalies'])} centers with anomalies, in {time.time() - start:.1f}s -> {report_dir}")
+    return centers, duplicates, repeats
+
+
+def write_report(report_dir, centers, duplicates, repeats):
+    os.makedirs(report_dir, exist_ok=True)
+
+    with open(os.path.join(report_dir, 'duplicates.csv'), 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['voter_no', 'center_count', 'centers', 'serial_nos'])
+        for voter_no, by_center in sorted(duplicates.items()):
+            writer.writerow([voter_no, len(by_center), ' | '.join(by_center),
+                             ' | '.join(' '.join(serial_nos) for serial_nos in by_center.values())])
+
+    with open(os.path.join(report_dir, 'repeats.csv'), 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['voter_no', 'center', 'count', 'serial_nos'])
+        for voter_no, file, serial_nos in sorted(repeats):
+            writer.writerow([voter_no, file, len(serial_nos), ' '.join(serial_nos)])
+
+    with open(os.path.join(report_dir, 'centers.csv'), 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(centers[0]) if centers else ['file'])
+        writer.writeheader()
+        writer.writerows(centers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Find duplicated voter numbers, missing serial numbers and row count anomalies in downloaded voter lists')
+    parser.add_argument('--source', type=str, default='voter_data', help='Folder of downloaded CSV files (flat or partitioned, plain or compressed)')
+    parser.add_argument('--report', type=str, default=REPORT_DIR, help='Folder to write duplicates.csv, repeats.csv and centers.csv to')
+    parser.add_argument('--expected', type=int, default=None, help='Expected number of voters, sizes the bloom filter (estimated from file sizes if not given)')
+    parser.add_argument('--province', type=str, default=None, help='Only check this province (id or name); needs a partitioned source folder')
+    parser.add_argument('--district', type=str, default=None, help='Only check this district (id or name); needs a partitioned source folder')
+    parser.add_argument('--municipality', type=str, default=None, help='Only check this municipality (id or name); needs a partitioned source folder')
+    parser.add_argument('--input_json', type=str, default='municipalities.json', help='JSON file with the list of municipalities, used to look up filters given by name')
+    args = parser.parse_args()
+
+    try:
+        csv_files = list_partition_files(args.source, args.province, args.district, args.municipality,
+                                         load_municipalities(args.input_json))
+    except ValueError as e:
+        parser.error(str(e))
+
+    check_integrity(csv_files, args.source, args.report, args.expected)
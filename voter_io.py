@@ -0,0 +1,140 @@
+import bz2
+import csv
+import gzip
+import lzma
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+import pandas as pd
+
+
+# stdlib codecs supported by every writer, and the file extension they add
+COMPRESSION_EXTENSIONS = {
+    'none': '',
+    'gzip': '.gz',
+    'bz2': '.bz2',
+    'xz': '.xz'
+}
+COMPRESSION_CHOICES = list(COMPRESSION_EXTENSIONS)
+# files being downloaded ('x.csv.gz.part') are written with the final file's codec
+PARTIAL_SUFFIX = '.part'
+
+
+def infer_compression(path):
+    path = Path(path)
+    if path.suffix == PARTIAL_SUFFIX:
+        path = path.with_suffix('')
+    suffix = path.suffix
+    for compression, extension in COMPRESSION_EXTENSIONS.items():
+        if extension and suffix == extension:
+            return compression
+    return 'none'
+
+
+def compressed_name(filename, compression='none'):
+    return f"{filename}{COMPRESSION_EXTENSIONS[compression or 'none']}"
+
+
+def csv_stem(path):
+    # 'a_1_b.csv.gz' -> 'a_1_b'
+    path = Path(path)
+    if infer_compression(path) != 'none':
+        path = path.with_suffix('')
+    return path.stem
+
+
+def list_csv_files(folder):
+    # plain and compressed csv files, in a stable order
+    files = []
+    for compression, extension in COMPRESSION_EXTENSIONS.items():
+        files.extend(Path(folder).glob(f"*.csv{extension}"))
+    return sorted(files)
+
+
+def to_csv_options(compression='none', level=None):
+    # keyword arguments for DataFrame.to_csv
+    if not compression or compression == 'none':
+        return {'compression': None}
+
+    options = {'method': compression}
+    if level is not None:
+        options['preset' if compression == 'xz' else 'compresslevel'] = level
+    return {'compression': options}
+
+
+def open_csv(path, mode='rt', compression='infer', level=None, encoding=None, newline=None):
+    # streams through the codec, nothing is decompressed up front
+    if compression == 'infer':
+        compression = infer_compression(path)
+
+    text_options = {'encoding': encoding, 'newline': newline} if 'b' not in mode else {}
+    if 't' not in mode and 'b' not in mode:
+        mode += 't'
+
+    if not compression or compression == 'none':
+        return open(path, mode, **text_options)
+    if compression == 'gzip':
+        return gzip.open(path, mode, compresslevel=9 if level is None else level, **text_options)
+    if compression == 'bz2':
+        return bz2.open(path, mode, compresslevel=9 if level is None else level, **text_options)
+    if compression == 'xz':
+        return lzma.open(path, mode, preset=level, **text_options)
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+def iter_csv_rows(path):
+    # row dicts of a downloaded voter list, one at a time
+    with open_csv(path, 'rt', encoding='utf-8-sig', newline='') as f:
+        yield from csv.DictReader(f)
+
+
+EXECUTOR_CHOICES = ['thread', 'process']
+
+
+def read_csv_files(paths, workers=1, executor='thread', **read_options):
+    # yields (path, DataFrame) in the order of paths; with workers > 1 files are
+    # parsed concurrently (threads suit slow disks, processes suit many cores),
+    # with a bounded number read ahead of the consumer
+    if workers <= 1:
+        for path in paths:
+            yield path, pd.read_csv(path, **read_options)
+        return
+
+    paths = iter(paths)
+    pool_class = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+    with pool_class(max_workers=workers) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append((path, pool.submit(pd.read_csv, path, **read_options)))
+            if len(pending) >= workers * 4:
+                break
+
+        while pending:
+            path, future = pending.popleft()
+            next_path = next(paths, None)
+            if next_path is not None:
+                pending.append((next_path, pool.submit(pd.read_csv, next_path, **read_options)))
+            yield path, future.result()
+
+
+def read_csv_header(path):
+    # first line only, much cheaper than asking pandas to open the file
+    with open_csv(path, 'rt', encoding='utf-8-sig', newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def combine_csv_files(paths, out, workers=1, executor='thread', log=print):
+    # appends every file to the open text file `out` in path order, with the
+    # columns of all files (like pd.concat); returns the number of rows written
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        headers = pool.map(read_csv_header, paths)
+        columns = list(dict.fromkeys(column for header in headers for column in header))
+
+    rows = 0
+    for i, (path, df) in enumerate(read_csv_files(paths, workers, executor)):
+        log(f"Reading: {Path(path).name}")
+        if list(df.columns) != columns:
+            df = df.reindex(columns=columns)
+        df.to_csv(out, index=False, header=i == 0)
+        rows += len(df)
+    return rows
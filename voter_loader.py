@@ -0,0 +1,127 @@
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from partitions import list_partition_files
+
+
+CHUNK_ROWS = 200000
+
+DEVANAGARI_DIGITS = str.maketrans('०१२३४५६७८९', '0123456789')
+
+# explicit schema for the downloaded, transformed and consolidated files;
+# columns not listed here stay as text
+CATEGORY_COLUMNS = [
+    'Province',
+    'Municipality/Village',
+    'Municipality/Village_en',
+    'Ward No.',
+    'Polling Place',
+    'Polling Place_en',
+    'Sex',
+    'लिङ्ग'
+]
+AGE_COLUMNS = ['Age', 'उमेर(वर्ष)']
+INT_COLUMNS = {
+    'सि.नं.': 'UInt32',
+    'मतदाता नं': 'UInt64'
+}
+FLAG_COLUMNS = {
+    'Married': {'Y': True, 'N': False}
+}
+
+
+def to_number(series, dtype):
+    # handles both '45' and '४५'
+    digits = series.astype('string').str.strip().str.translate(DEVANAGARI_DIGITS)
+    numbers = pd.to_numeric(digits, errors='coerce')
+    # values the dtype can not hold become NA instead of wrapping around ('300' -> 44)
+    limits = np.iinfo(pd.api.types.pandas_dtype(dtype).numpy_dtype)
+    valid = (numbers.between(limits.min, limits.max) & (numbers % 1 == 0)).fillna(False).astype(bool)
+    return numbers.where(valid).astype(dtype)
+
+
+def to_age(series):
+    return to_number(series, 'UInt8')
+
+
+def apply_schema(df):
+    for column in df.columns:
+        if column in CATEGORY_COLUMNS:
+            df[column] = df[column].astype('category')
+        elif column in AGE_COLUMNS:
+            df[column] = to_age(df[column])
+        elif column in INT_COLUMNS:
+            df[column] = to_number(df[column], INT_COLUMNS[column])
+        elif column in FLAG_COLUMNS:
+            df[column] = df[column].map(FLAG_COLUMNS[column]).astype('boolean')
+    return df
+
+
+def list_sources(source):
+    source = Path(source)
+    return [source] if source.is_file() else list_partition_files(source)
+
+
+def combine(chunks, columns):
+    # concat would turn categoricals with different categories back into
+    # objects, so categorical columns are unioned instead
+    combined = {}
+    for column in columns:
+        parts = [chunk[column] for chunk in chunks if column in chunk]
+        if parts and isinstance(parts[0].dtype, pd.CategoricalDtype):
+            combined[column] = pd.Series(union_categoricals(parts, ignore_order=True))
+        else:
+            combined[column] = pd.concat(parts, ignore_index=True) if parts else pd.Series(dtype=object)
+    return pd.DataFrame(combined)
+
+
+def load_voter_data(source, columns=None, chunksize=CHUNK_ROWS, report=False, log=print):
+    # source can be a single (consolidated) file or a folder of csv files;
+    # columns limits which columns are read at all
+    usecols = (lambda c: c in columns) if columns else None
+
+    chunks = []
+    memory_before = 0
+    for csv_file in list_sources(source):
+        for chunk in pd.read_csv(csv_file, dtype=str, usecols=usecols, chunksize=chunksize):
+            memory_before += chunk.memory_usage(index=False, deep=True).sum()
+            chunks.append(apply_schema(chunk))
+
+    if not chunks:
+        return pd.DataFrame(columns=columns or [])
+
+    ordered = list(chunks[0].columns)
+    for chunk in chunks[1:]:
+        ordered.extend(c for c in chunk.columns if c not in ordered)
+    if columns:
+        ordered = [c for c in columns if c in ordered]
+
+    df = combine(chunks, ordered)
+    memory_after = df.memory_usage(index=False, deep=True).sum()
+
+    df.attrs['memory_before'] = int(memory_before)
+    df.attrs['memory_after'] = int(memory_after)
+    if report:
+        log(memory_report(df))
+    return df
+
+
+def memory_report(df):
+    before = df.attrs.get('memory_before', 0)
+    after = df.attrs.get('memory_after', df.memory_usage(index=False, deep=True).sum())
+    ratio = before / after if after else 0
+    return (f"{len(df)} rows, {len(df.columns)} columns: "
+            f"{before / 1024 ** 2:.1f} MB as text -> {after / 1024 ** 2:.1f} MB typed ({ratio:.1f}x smaller)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load voter data with a compact typed schema and report memory use')
+    parser.add_argument('--source', type=str, default='single_file/consolidated_voter_info.csv', help='Consolidated CSV file or folder of CSV files')
+    parser.add_argument('--columns', type=str, nargs='+', default=None, help='Only load these columns')
+    args = parser.parse_args()
+
+    df = load_voter_data(args.source, args.columns, report=True)
+    print(df.dtypes.to_string())
+    print(df.memory_usage(index=False, deep=True).to_string())
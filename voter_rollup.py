@@ -0,0 +1,75 @@
+import argparse
+import os
+from collections import Counter
+import pandas as pd
+from voter_loader import to_age
+
+
+ROLLUP_FILE = 'voter_rollup.csv'
+
+DIMENSIONS = ['Province', 'Municipality/Village', 'Ward No.', 'Sex', 'Married', 'Age Band']
+AGE_BANDS = [18, 25, 35, 45, 55, 65, 75]
+
+
+def age_band(ages):
+    bins = AGE_BANDS + [200]
+    labels = [f"{lo}-{hi - 1}" for lo, hi in zip(AGE_BANDS[:-1], AGE_BANDS[1:])] + [f"{AGE_BANDS[-1]}+"]
+    bands = pd.cut(to_age(ages).astype('float'), bins=bins, labels=labels, right=False)
+    return bands.astype('object').fillna('Unknown')
+
+
+class RollupAccumulator:
+    # voter counts by province/municipality/ward/sex/married/age band, added
+    # one file at a time so the row level data never has to be loaded at once
+    def __init__(self):
+        self.counts = Counter()
+
+    def add(self, df):
+        keys = pd.DataFrame({
+            'Province': df['Province'],
+            'Municipality/Village': df['Municipality/Village'],
+            'Ward No.': df['Ward No.'].astype(str),
+            'Sex': df['Sex'],
+            'Married': df['Married'],
+            'Age Band': age_band(df['Age'])
+        })
+        for key, count in keys.groupby(DIMENSIONS, dropna=False, observed=True).size().items():
+            self.counts[key] += int(count)
+
+    def to_frame(self):
+        rows = [key + (count,) for key, count in sorted(self.counts.items())]
+        return pd.DataFrame(rows, columns=DIMENSIONS + ['Voters'])
+
+    def write(self, path=ROLLUP_FILE):
+        self.to_frame().to_csv(path, index=False, encoding='utf-8-sig')
+
+
+def load_rollup(path=ROLLUP_FILE):
+    return pd.read_csv(path, dtype={'Ward No.': str}, encoding='utf-8-sig')
+
+
+def summarize(rollup, by, where=None):
+    # answers summary queries from the small aggregate table
+    for column, value in (where or {}).items():
+        rollup = rollup[rollup[column].astype(str) == str(value)]
+    if not by:
+        return pd.DataFrame({'Voters': [rollup['Voters'].sum()]})
+    return rollup.groupby(by, dropna=False)['Voters'].sum().reset_index()
+
+
+if __name__ == "__main__":
+    options = {d.split('/')[0].split(' ')[0].lower(): d for d in DIMENSIONS}
+
+    parser = argparse.ArgumentParser(description='Query the voter count rollup written by transform.py')
+    parser.add_argument('--rollup', type=str, default=ROLLUP_FILE, help='Rollup file written by transform.py --rollup_file')
+    parser.add_argument('--by', type=str, nargs='*', default=[], choices=list(options), help='Group counts by these columns')
+    for option, column in options.items():
+        parser.add_argument(f'--{option}', type=str, default=None, help=f'Only count rows with this {column}')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.rollup):
+        parser.error(f"{args.rollup} not found, run transform.py with --rollup_file first")
+
+    where = {column: getattr(args, option) for option, column in options.items() if getattr(args, option) is not None}
+    result = summarize(load_rollup(args.rollup), [options[b] for b in args.by], where)
+    print(result.to_string(index=False))
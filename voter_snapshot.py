@@ -0,0 +1,252 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from voter_io import COMPRESSION_CHOICES, COMPRESSION_EXTENSIONS, compressed_name, infer_compression, iter_csv_rows
+
+
+SNAPSHOT_DIR = 'voter_snapshots'
+VOTER_NO = 'मतदाता नं'
+
+
+def center_key(task):
+    return f"{task['municipality_id']}/{task['ward_id']}/{task['reg_center_id']}"
+
+
+def hash_rows(rows):
+    # (hash, row count); rows can be a list or read one at a time from a file
+    digest = hashlib.sha256()
+    count = 0
+    for row in rows:
+        digest.update('\x1f'.join(str(v) for v in row.values()).encode('utf-8'))
+        digest.update(b'\x1e')
+        count += 1
+    return digest.hexdigest(), count
+
+
+def content_hash(voters_record):
+    return hash_rows(voters_record)[0]
+
+
+def read_voters(filepath):
+    return list(iter_csv_rows(filepath))
+
+
+def diff_voters(old_rows, new_rows):
+    # row level delta keyed by voter number
+    old = {row.get(VOTER_NO, ''): row for row in old_rows}
+    new = {str(row.get(VOTER_NO, '')): {k: str(v) for k, v in row.items()} for row in new_rows}
+
+    added = [new[k] for k in new if k not in old]
+    removed = [old[k] for k in old if k not in new]
+    changed = [(old[k], new[k]) for k in new if k in old and old[k] != new[k]]
+    return added, removed, changed
+
+
+def find_previous_file(filepath, previous=None):
+    # the center's last file, also when it was saved with another --compression
+    # or to another path (eg. before switching --layout)
+    filepath = str(filepath)
+    extension = COMPRESSION_EXTENSIONS[infer_compression(filepath)]
+    base = filepath[:-len(extension)] if extension else filepath
+    candidates = [filepath] + [compressed_name(base, c) for c in COMPRESSION_CHOICES]
+    if previous and previous.get('file'):
+        candidates.append(previous['file'])
+    for candidate in candidates:
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+class SnapshotStore:
+    # keeps a content hash per polling center so unchanged centers are not
+    # rewritten, and stores only the voter level changes of each run
+    def __init__(self, snapshot_dir=SNAPSHOT_DIR, log=print):
+        self.snapshot_dir = snapshot_dir
+        self.log = log
+        self.lock = threading.Lock()
+
+        # a second run started within the same second gets its own folder
+        started = time.strftime('%Y%m%d-%H%M%S')
+        self.run_id = started
+        attempt = 1
+        while True:
+            self.run_dir = os.path.join(snapshot_dir, 'runs', self.run_id)
+            try:
+                os.makedirs(self.run_dir)
+                break
+            except FileExistsError:
+                attempt += 1
+                self.run_id = f"{started}-{attempt}"
+        os.makedirs(os.path.join(self.run_dir, 'deltas'))
+
+        self.manifest_path = os.path.join(snapshot_dir, 'manifest.json')
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                self.manifest = json.load(f)
+
+        self.summary = {}
+
+    def check(self, task, voters_record, filepath):
+        # returns (hash, rows, delta, filepath) when the center changed and the file should
+        # be (re)written, None when it is unchanged; nothing is recorded until commit
+        return self._check(task, content_hash(voters_record), len(voters_record), lambda: voters_record, filepath)
+
+    def check_file(self, task, new_filepath, filepath):
+        # same as check for a streamed download already written to new_filepath;
+        # the rows are only loaded when the center changed and needs a delta
+        new_hash, rows = hash_rows(iter_csv_rows(new_filepath))
+        return self._check(task, new_hash, rows, lambda: read_voters(new_filepath), filepath)
+
+    def _check(self, task, new_hash, rows, load_rows, filepath):
+        previous = self.manifest.get(center_key(task))
+        if previous and previous['hash'] == new_hash and os.path.exists(filepath):
+            return None
+
+        previous_file = find_previous_file(filepath, previous)
+        if previous_file is None:
+            return new_hash, rows, None, filepath
+        if previous and previous['hash'] == new_hash:
+            # same voters, only saved with another compression before
+            return new_hash, rows, ([], [], []), filepath
+        return new_hash, rows, diff_voters(read_voters(previous_file), load_rows()), filepath
+
+    def unchanged(self, task):
+        self._count(task, 'unchanged_centers')
+
+    def commit(self, task, new_hash, rows, delta=None, filepath=None):
+        # called once the new file is in place, so a failed or cancelled write
+        # never leaves the manifest pointing at content that is not on disk
+        if delta is not None:
+            self._write_delta(task, *delta)
+        else:
+            self._count(task, 'new_centers')
+            self._count(task, 'added', rows)
+
+        with self.lock:
+            self.manifest[center_key(task)] = {
+                'hash': new_hash,
+                'rows': rows,
+                'file': str(filepath) if filepath else None,
+                'municipality_id': task['municipality_id'],
+                'municipality_name': task['municipality_name'],
+                'reg_center_name': task['reg_center_name'],
+                'run': self.run_id
+            }
+
+    def _count(self, task, field, amount=1):
+        with self.lock:
+            stats = self.summary.setdefault(task['municipality_id'], {
+                'municipality_name': task['municipality_name'],
+                'unchanged_centers': 0,
+                'changed_centers': 0,
+                'new_centers': 0,
+                'added': 0,
+                'removed': 0,
+                'changed': 0
+            })
+            stats[field] += amount
+
+    def _write_delta(self, task, added, removed, changed):
+        self._count(task, 'changed_centers' if added or removed or changed else 'unchanged_centers')
+        self._count(task, 'added', len(added))
+        self._count(task, 'removed', len(removed))
+        self._count(task, 'changed', len(changed))
+
+        key = center_key(task)
+        records = (
+            [{'center': key, 'type': 'added', 'voter_no': r.get(VOTER_NO, ''), 'new': r} for r in added]
+            + [{'center': key, 'type': 'removed', 'voter_no': r.get(VOTER_NO, ''), 'old': r} for r in removed]
+            + [{'center': key, 'type': 'changed', 'voter_no': o.get(VOTER_NO, ''), 'old': o, 'new': n} for o, n in changed]
+        )
+        if not records:
+            return
+
+        delta_path = os.path.join(self.run_dir, 'deltas', f"{task['municipality_id']}.jsonl")
+        with self.lock:
+            with open(delta_path, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def save(self):
+        with self.lock:
+            with open(self.manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(self.manifest, f, ensure_ascii=False)
+            os.replace(self.manifest_path + '.tmp', self.manifest_path)
+
+            with open(os.path.join(self.run_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+                json.dump(self.summary, f, ensure_ascii=False, indent=2)
+
+        unchanged = sum(s['unchanged_centers'] for s in self.summary.values())
+        self.log(f"Snapshot {self.run_id}: {unchanged} unchanged centers skipped, "
+                 f"{sum(s['added'] for s in self.summary.values())} added, "
+                 f"{sum(s['removed'] for s in self.summary.values())} removed, "
+                 f"{sum(s['changed'] for s in self.summary.values())} changed voters")
+
+
+def list_runs(snapshot_dir=SNAPSHOT_DIR):
+    runs_dir = os.path.join(snapshot_dir, 'runs')
+    if not os.path.isdir(runs_dir):
+        return []
+    return sorted(r for r in os.listdir(runs_dir) if os.path.exists(os.path.join(runs_dir, r, 'summary.json')))
+
+
+def load_summary(snapshot_dir, run_id):
+    with open(os.path.join(snapshot_dir, 'runs', run_id, 'summary.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def diff_report(snapshot_dir=SNAPSHOT_DIR, run_id=None, municipality=None):
+    # per municipality change counts of a run, read from the small summary file
+    runs = list_runs(snapshot_dir)
+    if not runs:
+        return []
+    run_id = run_id or runs[-1]
+
+    report = []
+    for municipality_id, stats in sorted(load_summary(snapshot_dir, run_id).items()):
+        if municipality and municipality not in (municipality_id, stats['municipality_name']):
+            continue
+        report.append(dict(stats, municipality_id=municipality_id, run=run_id))
+    return report
+
+
+def iter_deltas(snapshot_dir, run_id, municipality_id):
+    delta_path = os.path.join(snapshot_dir, 'runs', run_id, 'deltas', f"{municipality_id}.jsonl")
+    if not os.path.exists(delta_path):
+        return
+    with open(delta_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Report voter list changes between download runs')
+    parser.add_argument('--snapshot_dir', type=str, default=SNAPSHOT_DIR, help='Snapshot folder used by the downloader')
+    parser.add_argument('--run', type=str, default=None, help='Run id to report on (default: latest run)')
+    parser.add_argument('--municipality', type=str, default=None, help='Only report this municipality (id or name)')
+    parser.add_argument('--details', action='store_true', help='Also list the added/removed/changed voters')
+    parser.add_argument('--list_runs', action='store_true', help='List the recorded runs')
+    args = parser.parse_args()
+
+    if args.list_runs:
+        for run_id in list_runs(args.snapshot_dir):
+            print(run_id)
+    else:
+        report = diff_report(args.snapshot_dir, args.run, args.municipality)
+        if not report:
+            print("No snapshot runs found")
+
+        for stats in report:
+            print(f"{stats['municipality_id']} - {stats['municipality_name']}: "
+                  f"+{stats['added']} -{stats['removed']} ~{stats['changed']} voters "
+                  f"({stats['changed_centers']} changed, {stats['new_centers']} new, "
+                  f"{stats['unchanged_centers']} unchanged centers)")
+
+            if args.details:
+                for delta in iter_deltas(args.snapshot_dir, stats['run'], stats['municipality_id']):
+                    row = delta.get('new') or delta.get('old')
+                    print(f"    {delta['type']:8} {delta['voter_no']}\t{row.get('मतदाताको नाम', '')}\t{delta['center']}")
@@ -0,0 +1,142 @@
+import codecs
+import csv
+import os
+from html.parser import HTMLParser
+from requests.utils import get_encoding_from_headers
+from voter_io import open_csv
+
+
+CHUNK_SIZE = 64 * 1024
+
+HEADERS = [
+    'सि.नं.',
+    'मतदाता नं',
+    'मतदाताको नाम',
+    'उमेर(वर्ष)',
+    'लिङ्ग',
+    'पति/पत्नीको नाम',
+    'पिता/माताको नाम',
+    'मतदाता विवरण'
+]
+
+
+class VoterTableParser(HTMLParser):
+    # incremental parser for the view_ward.php page: each row of
+    # table#tbl_data > tbody is handed to on_row as soon as it is complete,
+    # no tree is built. Cell text matches BeautifulSoup's get_text(strip=True)
+    def __init__(self, on_row):
+        super().__init__()
+        self.on_row = on_row
+        self.found_table = False
+        self.rows = 0
+
+        self.depth = 0          # table nesting inside tbl_data, 0 = outside
+        self.done = False       # only the first tbl_data is read
+        self.in_tbody = False
+        self.cells = None       # cells of the current row
+        self.cell = None        # text pieces of the current cell
+        self.text = []          # current text node, may arrive in several feeds
+
+    def _end_text(self):
+        if self.cell is not None and self.text:
+            piece = ''.join(self.text).strip()
+            if piece:
+                self.cell.append(piece)
+        self.text = []
+
+    def _end_cell(self):
+        if self.cell is not None:
+            self.cells.append(''.join(self.cell))
+            self.cell = None
+
+    def _end_row(self):
+        self._end_cell()
+        if self.cells is not None and len(self.cells) >= len(HEADERS):
+            self.rows += 1
+            self.on_row(self.cells[:len(HEADERS)])
+        self.cells = None
+
+    def handle_starttag(self, tag, attrs):
+        self._end_text()
+        if not self.depth:
+            if tag == 'table' and not self.done and dict(attrs).get('id') == 'tbl_data':
+                self.found_table = True
+                self.depth = 1
+            return
+
+        if tag == 'table':
+            self.depth += 1
+        elif tag == 'tbody':
+            self.in_tbody = True
+        elif tag == 'tr' and self.in_tbody:
+            self._end_row()
+            self.cells = []
+        elif tag == 'td' and self.cells is not None:
+            self._end_cell()
+            self.cell = []
+
+    def handle_endtag(self, tag):
+        self._end_text()
+        if not self.depth:
+            return
+
+        if tag == 'td':
+            self._end_cell()
+        elif tag == 'tr':
+            self._end_row()
+        elif tag == 'tbody':
+            self._end_row()
+            self.in_tbody = False
+        elif tag == 'table':
+            self.depth -= 1
+            if not self.depth:
+                self._end_row()
+                self.in_tbody = False
+                self.done = True
+
+    def handle_data(self, data):
+        if self.cell is not None:
+            self.text.append(data)
+
+    def handle_comment(self, data):
+        self._end_text()
+
+    def close(self):
+        super().close()
+        self._end_text()
+        if self.depth:
+            self._end_row()
+
+
+def response_encoding(response):
+    # requests assumes ISO-8859-1 for text/html without a charset, the voter lists are utf-8
+    if 'charset' in response.headers.get('content-type', '').lower():
+        return get_encoding_from_headers(response.headers)
+    return 'utf-8'
+
+
+def iter_body(response, chunk_size=CHUNK_SIZE):
+    try:
+        yield from response.iter_content(chunk_size)
+    finally:
+        response.close()
+
+
+def parse_voter_stream(chunks, on_row, encoding='utf-8'):
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    parser = VoterTableParser(on_row)
+    for chunk in chunks:
+        parser.feed(decoder.decode(chunk))
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    return parser
+
+
+def write_voter_stream(chunks, filepath, compression='none', level=None, encoding='utf-8'):
+    # parses the response while it downloads and writes every voter row to
+    # filepath as it arrives; returns (table found, rows written)
+    with open_csv(filepath, 'wt', compression, level, encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f, lineterminator=os.linesep)
+        writer.writerow(HEADERS)
+        parser = parse_voter_stream(chunks, writer.writerow, encoding)
+    return parser.found_table, parser.rows